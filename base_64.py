@@ -2,10 +2,7 @@
 # one base64 digit is six bits of data
 # https://cryptopals.com/sets/1/challenges/1
 
-import base64
-import binascii
-
-from util import groups, hexbytes_to_bytestr
+from util import groups
 
 # Table of base64 values. Each index in the list is the int equal to the character in that position.
 # base64_table[64] is the default padding character, '='
@@ -189,61 +186,6 @@ def base64_to_bytes(b64data):
     return bytes(decoded)
 
 
-#######
-# TESTS
-def test_hex_to_base64():
-    '''
-    Tests that work with pytest and Nosetest test frameworks.
-    '''
-
-    tests = {'49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726f6f6d':'SSdtIGtpbGxpbmcgeW91ciBicmFpbiBsaWtlIGEgcG9pc29ub3VzIG11c2hyb29t',
-             '49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726f6f6': 'SSdtIGtpbGxpbmcgeW91ciBicmFpbiBsaWtlIGEgcG9pc29ub3VzIG11c2hyb28G',
-             '49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726f6f': 'SSdtIGtpbGxpbmcgeW91ciBicmFpbiBsaWtlIGEgcG9pc29ub3VzIG11c2hyb28=',
-             '49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726f6': 'SSdtIGtpbGxpbmcgeW91ciBicmFpbiBsaWtlIGEgcG9pc29ub3VzIG11c2hybwY=',
-             '49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726f': 'SSdtIGtpbGxpbmcgeW91ciBicmFpbiBsaWtlIGEgcG9pc29ub3VzIG11c2hybw==',
-             '49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726': 'SSdtIGtpbGxpbmcgeW91ciBicmFpbiBsaWtlIGEgcG9pc29ub3VzIG11c2hyBg=='
-             }
-
-    # Test everything in the dict. Key is hexbytes, value is base64.
-    for test in tests:
-        assert bytes_to_base64(hexbytes_to_bytestr(test.encode())) == tests[test]
-
-        if len(test) % 2 != 0:
-            pass
-        else:
-            assert bytes_to_base64(hexbytes_to_bytestr(test.encode())) == base64.b64encode(binascii.unhexlify(test)).decode()
-
-    # Test a single case if needed:
-    # t = '49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726f'
-    # a = bytes_to_base64(hexbytes_to_bytestr(t.encode()))
-    # b = base64.b64encode(binascii.unhexlify(t)).decode()
-    # assert a == b
-
-    data = '49276d206b696c6c696e6720796f757220627261696e206c696b65206120706f69736f6e6f7573206d757368726f6f6d'
-    bin_data = data.encode()
-    unhex = binascii.unhexlify(data)
-    # unhex = binascii.unhexlify(bin_data)
-    print(unhex)
-    b64 = base64.b64encode(unhex)
-    print(b64.decode())
-    # print(b64)
-
-    s = hexbytes_to_bytestr(bin_data)
-    print(bytes_to_base64(s))
-
-    # hexlify output test
-    print('hexlify output type:', type(binascii.hexlify(unhex)))
-
-
-def test_base64_to_bytes():
-    print(base64_to_bytes(b'aaaa'))
-    print(base64_to_bytes(b'VGhpcyBpcyBvbmx5IGEgdGVz'))  # 'This is only a tes'
-    print(base64_to_bytes(b'VGhpcyBpcyBvbmx5IGEgdGVzdA=='))  # 'This is only a test'
-    print(base64_to_bytes(b'VEhJUyBJUyBPTkxZIEEgVEVTVA=='))  # 'THIS IS ONLY A TEST'
-    print(base64_to_bytes(b'VGhpcyBJcyBPbmw='))  # 'This Is Onl'
-
-    print(base64_to_bytes('VGhpcyBJcyBPbmw='))  # 'This Is Onl'
-
 # Base64 Table
 ''' Base64 Table
 
@@ -0,0 +1,295 @@
+# Benchmarks for the xor and util primitives and the end-to-end solvers.
+#
+# Run everything and print seconds per call:
+#   python bench.py
+# Store the results as a baseline:
+#   python bench.py --output bench_baseline.json
+# Fail (exit code 1) if anything got more than 25% slower than the baseline:
+#   python bench.py --compare bench_baseline.json --threshold 0.25
+# Only run some benchmarks:
+#   python bench.py --filter fixed_xor --filter chall6
+#
+# The import[...] benchmarks time a fresh interpreter importing each library module (python -X importtime), and fail
+# the run if a module takes longer than its entry in IMPORT_BUDGETS.
+
+# standard library imports
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from functools import lru_cache
+
+# local code imports
+import block
+import memo
+import util
+import xor
+
+# Minimum time spent timing each benchmark, per repeat.
+MIN_TIME = 0.2
+REPEATS = 3
+DEFAULT_THRESHOLD = 0.25
+
+# Input sizes in bytes for the primitives.
+SIZES = [16, 4096, 1 << 20]
+SCORE_SIZES = [34, 4096]
+HEX_SIZES = [64, 4096, 1 << 16]
+CBC_SIZES = [4096, 1 << 20, 1 << 22]
+CBC_PARALLEL_SIZES = [1 << 22, 1 << 24]
+CBC_WORKERS = [2, 4, 8]
+
+# Seconds allowed for a cold import of each library module, including everything it imports. Generous, since the
+# interpreter start up is noisy; they are there to catch a heavy import sneaking back in at module level.
+# The unit tests only check the import budgets when this is set, since wall clock times are noisy on busy machines.
+IMPORT_BUDGET_ENV_VAR = 'CRYPTOPALS_IMPORT_BUDGET'
+IMPORT_BUDGETS = {'util': 0.1, 'xor': 0.15, 'block': 0.15, 'base_64': 0.1, 'memo': 0.05}
+
+
+def synthetic_bytes(size, seed=0):
+    # Deterministic random bytes, so runs compare like with like.
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+
+@lru_cache()
+def load_6():
+    with open('6.txt') as f:
+        return base64.b64decode(f.read())
+
+
+@lru_cache()
+def english_text():
+    # The decrypted Set 1, Challenge 6 lyrics.
+    return xor.break_repeating_key_xor(load_6(), workers=1).plaintext
+
+
+def synthetic_english(size):
+    text = english_text()
+    return (text * (size // len(text) + 1))[:size]
+
+
+def memoized_call(func, *args, **kwargs):
+    # func with the in-memory cache on, so every call after the first is a cache hit
+    with memo.enabled():
+        return func(*args, **kwargs)
+
+
+def benchmarks():
+    '''
+    All benchmarks, as a dict of name: function of no arguments. Inputs are built here, outside of the timed calls.
+    '''
+    benches = {}
+
+    for size in SIZES:
+        one, two = synthetic_bytes(size, 1), synthetic_bytes(size, 2)
+        benches['fixed_xor[%d]' % size] = lambda one=one, two=two: xor.fixed_xor(one, two)
+        benches['hamming_dist[%d]' % size] = lambda one=one, two=two: xor.hamming_dist(one, two)
+
+    for size in HEX_SIZES:
+        data = synthetic_bytes(size, 3)
+        hexbytes = util.bytestr_to_hexbytes(data)
+        benches['hexbytes_to_bytestr[%d]' % size] = lambda hexbytes=hexbytes: util.hexbytes_to_bytestr(hexbytes)
+        benches['bytestr_to_hexbytes[%d]' % size] = lambda data=data: util.bytestr_to_hexbytes(data)
+
+    for size in SCORE_SIZES:
+        text = synthetic_english(size)
+        for func in [util.plaintext_score, util.plaintext_score_complex, util.plaintext_score_diff_from_norm,
+                     util.plaintext_score_ngram]:
+            benches['%s[%d]' % (func.__name__, size)] = lambda func=func, text=text: func(text)
+        if os.path.exists(util.DICTIONARY_FILE):
+            benches['plaintext_score_dict[%d]' % size] = lambda text=text: util.plaintext_score_dict(text)
+
+        cipher = xor.single_byte_xor(text, b'\x35')
+        benches['decode_all_single_byte_xor[%d]' % size] = lambda cipher=cipher: xor.decode_all_single_byte_xor(cipher)
+        benches['decode_single_byte_xor_histogram[%d]' % size] = \
+            lambda cipher=cipher: xor.decode_single_byte_xor_histogram(cipher)
+
+    # ciphertexts are made with pycryptodome's own CBC, which matches block.aes_cbc_encrypt() on whole blocks and is
+    # much faster to set up
+    AES = block.load_aes()
+    key, iv = synthetic_bytes(16, 4), synthetic_bytes(16, 5)
+    for size in CBC_SIZES:
+        data = synthetic_bytes(size, 6)
+        cipher = AES.new(key=key, mode=AES.MODE_CBC, iv=iv).encrypt(data)
+        benches['aes_cbc_encrypt[%d]' % size] = lambda data=data: block.aes_cbc_encrypt(data, key, iv)
+        benches['aes_cbc_decrypt[%d]' % size] = lambda cipher=cipher: block.aes_cbc_decrypt(cipher, key, iv)
+        # pycryptodome's own CBC, the ceiling for the pure Python chaining
+        benches['native_cbc_encrypt[%d]' % size] = \
+            lambda data=data: AES.new(key=key, mode=AES.MODE_CBC, iv=iv).encrypt(data)
+        benches['native_cbc_decrypt[%d]' % size] = \
+            lambda cipher=cipher: AES.new(key=key, mode=AES.MODE_CBC, iv=iv).decrypt(cipher)
+
+    stream_data = synthetic_bytes(CBC_SIZES[-1], 9)
+    benches['aes_encrypt_stream[CBC,%d]' % len(stream_data)] = \
+        lambda: block.aes_encrypt_stream(io.BytesIO(stream_data), io.BytesIO(), key, 'CBC', iv)
+    stream_cipher = AES.new(key=key, mode=AES.MODE_CBC, iv=iv).encrypt(stream_data + bytes([16]) * 16)
+    benches['aes_decrypt_stream[CBC,%d]' % len(stream_cipher)] = \
+        lambda: block.aes_decrypt_stream(io.BytesIO(stream_cipher), io.BytesIO(), key, 'CBC', iv)
+
+    for size in CBC_SIZES:
+        ecb_cipher = synthetic_bytes(size, 10)
+        benches['detect_aes_ecb[%d]' % size] = lambda ecb_cipher=ecb_cipher: block.detect_aes_ecb(ecb_cipher)
+    benches['rank_ecb_lines[8.txt]'] = lambda: block.rank_ecb_lines('8.txt', workers=1)
+
+    # Set 2, Challenge 12 style oracle query: attacker bytes and a secret suffix under one key
+    query = synthetic_bytes(15, 8) + synthetic_english(138)
+    benches['aes_ecb_oracle[cached]'] = lambda: block.aes_ecb_encrypt(query, key)
+    benches['aes_ecb_oracle[uncached]'] = lambda: (block.aes_cipher.cache_clear(), block.aes_ecb_encrypt(query, key))
+
+    for size in CBC_PARALLEL_SIZES:
+        cipher = AES.new(key=key, mode=AES.MODE_CBC, iv=iv).encrypt(synthetic_bytes(size, 7))
+        for workers in CBC_WORKERS:
+            benches['aes_cbc_decrypt[%d,workers=%d]' % (size, workers)] = \
+                lambda cipher=cipher, workers=workers: block.aes_cbc_decrypt(cipher, key, iv, workers=workers)
+
+    cipher = load_6()
+    benches['rank_xor_key_lengths[6.txt]'] = lambda: xor.rank_xor_key_lengths(cipher, workers=1)
+
+    # end-to-end solvers
+    benches['chall4_scan[4.txt]'] = lambda: xor.scan_single_byte_xor('4.txt', workers=1)
+    benches['chall6_break[6.txt]'] = lambda: xor.break_repeating_key_xor(cipher, workers=1)
+    benches['chall6_break_memoized[6.txt]'] = lambda: memoized_call(xor.break_repeating_key_xor, cipher, workers=1)
+    big_cipher = xor.repeating_key_xor(synthetic_english(1 << 16), b'Terminator X: Bring the noise')
+    benches['chall6_break[65536]'] = lambda: xor.break_repeating_key_xor(big_cipher, workers=1)
+
+    return benches
+
+
+def time_call(func, min_time=MIN_TIME, repeats=REPEATS):
+    '''
+    Seconds per call of func. Calls are batched until a batch takes at least min_time, and the best of repeats
+    batches is kept.
+    '''
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed * 1.2))
+
+    best = elapsed
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def import_time(module, repeats=REPEATS):
+    '''
+    Seconds taken to import module in a new interpreter, measured by python -X importtime. The best of repeats runs
+    is kept.
+    :param module: Module name, ie. 'xor'.
+    :return: Cumulative import time of the module in seconds.
+    '''
+    best = None
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        # lines look like 'import time:       523 |      36991 | module' with times in microseconds
+        for line in proc.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                seconds = int(fields[1]) / 1e6
+                best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def over_budget(results, budgets=IMPORT_BUDGETS):
+    '''
+    Find modules whose import[...] result is over their budget.
+    :param results: Dict of name: seconds, as returned by run().
+    :param budgets: Dict of module: seconds allowed.
+    :return: List of (module, budget seconds, seconds), empty if every import is within budget.
+    '''
+    return [(module, budget, results['import[%s]' % module]) for module, budget in sorted(budgets.items())
+            if 'import[%s]' % module in results and results['import[%s]' % module] > budget]
+
+
+def run(filters=None, min_time=MIN_TIME, repeats=REPEATS, report=print):
+    '''
+    Run the benchmarks whose name contains any of filters (all of them if filters is empty).
+    :return: Dict of name: seconds per call.
+    '''
+    results = {}
+    for name, func in benchmarks().items():
+        if filters and not any(f in name for f in filters):
+            continue
+        results[name] = time_call(func, min_time, repeats)
+        if report:
+            report('%-45s %12.3f us' % (name, results[name] * 1e6))
+
+    for module in IMPORT_BUDGETS:
+        name = 'import[%s]' % module
+        if filters and not any(f in name for f in filters):
+            continue
+        results[name] = import_time(module, repeats)
+        if report:
+            report('%-45s %12.3f us' % (name, results[name] * 1e6))
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    '''
+    Find benchmarks that got slower than the baseline by more than threshold (0.25 is 25% slower). Benchmarks missing
+    from either side are ignored.
+    :param results: Dict of name: seconds per call.
+    :param baseline: Dict of name: seconds per call.
+    :return: List of (name, baseline seconds, new seconds), empty if nothing regressed.
+    '''
+    return [(name, baseline[name], seconds) for name, seconds in sorted(results.items())
+            if name in baseline and seconds > baseline[name] * (1 + threshold)]
+
+
+def save(path, results):
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results}, f,
+                  indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cryptopals primitives and solvers.')
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    parser.add_argument('--compare', help='Baseline JSON file to check for regressions.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed slowdown before a benchmark counts as a regression (default %(default)s).')
+    parser.add_argument('--filter', action='append', default=[], help='Only run benchmarks containing this text.')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME, help='Seconds to time each benchmark for.')
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.min_time)
+
+    if args.output:
+        save(args.output, results)
+
+    failed = False
+    for module, budget, seconds in over_budget(results):
+        print('OVER BUDGET import %s: %.1f ms (budget %.1f ms)' % (module, seconds * 1e3, budget * 1e3))
+        failed = True
+
+    if args.compare:
+        regressions = compare(results, load(args.compare), args.threshold)
+        for name, before, after in regressions:
+            print('REGRESSION %s: %.3f us -> %.3f us (%+.0f%%)' % (name, before * 1e6, after * 1e6,
+                                                                   (after / before - 1) * 100))
+        if regressions:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
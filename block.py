@@ -2,19 +2,77 @@
 # https://pypi.python.org/pypi/pycrypto/
 # https://pythonhosted.org/pycrypto/
 
-import base64
+import concurrent.futures
+import heapq
 import itertools
 # import secrets
 import os  # TODO use Python 3.6 secrets
 import random
-
-from Crypto.Cipher import AES
+from collections import namedtuple
+from contextlib import ExitStack
+from functools import lru_cache, partial
 
 import util
-import xor
+from instrument import probe
 
 BLOCK_SIZE = 16
 
+# Initialized ciphers kept by aes_cipher().
+CIPHER_CACHE_SIZE = 64
+
+# Ciphertexts shorter than this are decrypted in this thread, even when more workers are allowed.
+PARALLEL_MIN_BYTES = 1 << 22
+
+# Lines of hex sent to a worker at a time by rank_ecb_lines().
+ECB_SCAN_BATCH_LINES = 4096
+
+EcbStats = namedtuple('EcbStats', 'blocks duplicates repetition_ratio')
+
+EcbLineResult = namedtuple('EcbLineResult', 'line_number blocks duplicates repetition_ratio')
+
+# Bytes read per chunk by aes_encrypt_stream() and aes_decrypt_stream().
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Crypto.Cipher.AES and Crypto.Util.strxor.strxor, imported by load_aes() the first time a cipher is needed.
+# Importing pycryptodome takes longer than the rest of this module, and most users of block.py never build a cipher.
+AES = None
+strxor = None
+
+
+def load_aes():
+    '''
+    Import the AES backend on first use.
+    :return: The Crypto.Cipher.AES module.
+    '''
+    global AES, strxor
+    if AES is None:
+        from Crypto.Cipher import AES as aes_module
+        from Crypto.Util.strxor import strxor as strxor_func
+        # strxor first: other threads take AES being set to mean the backend is ready
+        strxor = strxor_func
+        AES = aes_module
+    return AES
+
+
+@lru_cache(maxsize=CIPHER_CACHE_SIZE)
+def aes_cipher(key, mode=None):
+    '''
+    Initialized AES cipher for key, shared by every call with the same key and mode so the key schedule is only set up
+    once. An oracle called thousands of times with one key builds its cipher once. lru_cache keeps the cache bounded
+    and thread safe, and aes_cipher.cache_info() has the hit and miss counts.
+    Only ECB ciphers are cached. Chaining modes keep state between calls, so they can't be shared.
+    :param key: Bytes (hashable, so bytes(key) for a bytearray).
+    :param mode: AES mode, AES.MODE_ECB if None.
+    :return: AES cipher object.
+    '''
+    AES = load_aes()
+    if mode is None:
+        mode = AES.MODE_ECB
+    if mode != AES.MODE_ECB:
+        raise ValueError('Only ECB ciphers are stateless and can be cached.', mode)
+    return AES.new(key=key, mode=mode)
+
+
 def pkcs7pad(text, length):
     # Common padding for CBC mode block ciphers
     if len(text) > length:
@@ -26,6 +84,7 @@ def pkcs7pad(text, length):
     return text + padding
 
 
+@probe
 def aes_ecb_encrypt(data, key):
     '''
     Encrypt bytes using AES ECB algorithm.
@@ -35,9 +94,10 @@ def aes_ecb_encrypt(data, key):
     '''
     diff = BLOCK_SIZE - (len(data) % BLOCK_SIZE)
     padding = bytearray([diff for x in range(diff)])
-    return AES.new(key=key, mode=AES.MODE_ECB).encrypt(data + padding)
+    return aes_cipher(bytes(key)).encrypt(data + padding)
 
 
+@probe
 def aes_ecb_decrypt(data, key):
     '''
     Decrypt bytes using AES ECB algorithm.
@@ -46,7 +106,7 @@ def aes_ecb_decrypt(data, key):
     :return:
     '''
 
-    plaintext = AES.new(key=key, mode=AES.MODE_ECB).decrypt(data)
+    plaintext = aes_cipher(bytes(key)).decrypt(data)
     # TODO remove padding
     # detect and remove PKCS7 padding
     if plaintext[-1] < BLOCK_SIZE:
@@ -55,98 +115,290 @@ def aes_ecb_decrypt(data, key):
     return plaintext
 
 
+@probe
 def aes_cbc_encrypt(data, key, IV):
     '''
     Encrypt Cipher Block Chaining (CBC) with AES on each block.
     https://en.wikipedia.org/wiki/Block_cipher_mode_of_operation#Cipher_Block_Chaining_(CBC)
+    Each block is XORed with the previous ciphertext block as integers and encrypted straight into one preallocated
+    output buffer, so the cost is linear in the length of data. A short last block is padded with pkcs7pad(), data
+    that is a whole number of blocks is not padded.
     :param data: Plaintext bytes.
     :param key: Bytes to encrypt.
     :param IV: Initialization Vector. Must be block size (16 bytes default).
-    :return:
+    :return: Bytes
     '''
 
     if len(IV) is not BLOCK_SIZE:
         raise ValueError("IV must be " + str(BLOCK_SIZE) + " bytes.")
 
-    # AES instance for decrypting
-    aes_cipher = AES.new(key=key, mode=AES.MODE_ECB)
-
-    # iterator for grabbing sequential blocks from data
-    next_block = util.groups(data, BLOCK_SIZE)
-    all_blocks = list(next_block)
+    # AES instance for encrypting, reused for every block
+    ecb_cipher = aes_cipher(bytes(key))
 
-    # first block
-    plain_block = all_blocks[0]
+    data = memoryview(data).cast('B')
+    whole = len(data) - len(data) % BLOCK_SIZE
+    result = bytearray(whole + (BLOCK_SIZE if whole < len(data) else 0))
+    result_view = memoryview(result)
 
-    # xor with IV
-    xor_block = xor.fixed_xor(plain_block, IV)
-    # print(xor_block, len(xor_block), type(xor_block))
+    # the previous ciphertext block, starting with the IV
+    prev_cipher_block = int.from_bytes(IV, 'little')
+    for start in range(0, whole, BLOCK_SIZE):
+        out = result_view[start:start + BLOCK_SIZE]
+        xor_block = int.from_bytes(data[start:start + BLOCK_SIZE], 'little') ^ prev_cipher_block
+        ecb_cipher.encrypt(xor_block.to_bytes(BLOCK_SIZE, 'little'), output=out)
+        prev_cipher_block = int.from_bytes(out, 'little')
 
-    # encrypt
-    encrypt_block = aes_cipher.encrypt(xor_block)
-    result = encrypt_block
+    if whole < len(data):
+        plain_block = pkcs7pad(bytes(data[whole:]), BLOCK_SIZE)
+        xor_block = int.from_bytes(plain_block, 'little') ^ prev_cipher_block
+        ecb_cipher.encrypt(xor_block.to_bytes(BLOCK_SIZE, 'little'), output=result_view[whole:])
 
-    prev_cipher_block = encrypt_block
-    # while more data:
-    for plain_block in all_blocks[1:]:
-        if len(plain_block) < BLOCK_SIZE:
-            plain_block = pkcs7pad(plain_block, BLOCK_SIZE)
-        xor_block = xor.fixed_xor(prev_cipher_block, plain_block)
-        decrypt_block = aes_cipher.encrypt(xor_block)
-        # print(xor_block, len(xor_block))
-        result += decrypt_block
-        prev_cipher_block = decrypt_block
-        # encrypt next block
-    return result
+    return bytes(result)
 
 
-def aes_cbc_decrypt(data, key, IV):
+@probe
+def aes_cbc_decrypt(data, key, IV, workers=1):
     '''
     Decrypt Cipher Block Chaining (CBC) with AES on each block.
     https://en.wikipedia.org/wiki/Block_cipher_mode_of_operation#Cipher_Block_Chaining_(CBC)
+    Every plaintext block only needs its own ciphertext block and the one before it, so the ciphertext is split into
+    block aligned shards that are decrypted independently into one preallocated buffer, see aes_cbc_decrypt_shard().
+    pycryptodome releases the GIL while it decrypts and XORs, so the shards run on threads.
     :param data: Encrypted bytes.
     :param key: Bytes to decrypt.
     :param IV: Initialization Vector. Must be block size (16 bytes default).
-    :return:
+    :param workers: Threads used to decrypt shards. None uses every core for ciphertexts of at least
+    PARALLEL_MIN_BYTES and this thread for shorter ones. 1 or less decrypts in this thread.
+    :return: Bytes
     '''
 
     if len(IV) is not BLOCK_SIZE:
         raise ValueError("IV must be " + str(BLOCK_SIZE) + " bytes.")
+    if len(data) % BLOCK_SIZE:
+        raise ValueError("Ciphertext must be a multiple of " + str(BLOCK_SIZE) + " bytes.", len(data))
+
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(data) >= PARALLEL_MIN_BYTES else 1
+    workers = max(1, workers)
+    # load the backend and cache the cipher before any shard thread needs them
+    aes_cipher(bytes(key))
+    data = memoryview(data).cast('B')
+    result = bytearray(len(data))
+
+    # whole blocks per shard, the last shard takes what is left
+    num_blocks = len(data) // BLOCK_SIZE
+    shard_blocks = max(1, -(-num_blocks // workers))
+    shards = [(start, min(start + shard_blocks * BLOCK_SIZE, len(data)))
+              for start in range(0, len(data), shard_blocks * BLOCK_SIZE)]
+    if len(shards) <= 1:
+        for start, end in shards:
+            aes_cbc_decrypt_shard(data, key, IV, result, start, end)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() re-raises any exception from a shard
+            list(executor.map(lambda shard: aes_cbc_decrypt_shard(data, key, IV, result, *shard), shards))
 
-    # AES instance for decrypting
-    aes_cipher = AES.new(key=key, mode=AES.MODE_ECB)
+    # detect and remove PKCS7 padding
+    if result[-1] < BLOCK_SIZE:
+        # how many bytes to remove? BLOCK_SIZE - result[-1]
+        del result[-result[-1]:]
 
-    # iterator for grabbing sequential blocks from data
-    next_block = util.groups(data, BLOCK_SIZE)
-    all_blocks = list(next_block)
+    return bytes(result)
 
-    # 0th block with IV
-    cipher_block = all_blocks[0]
 
-    # decrypt first block
-    decrypt_block = aes_cipher.decrypt(cipher_block)
+def aes_cbc_decrypt_shard(data, key, IV, result, start, end):
+    '''
+    Decrypt the CBC blocks in data[start:end] into result[start:end]. The block before start (or the IV) is the one
+    block of overlap a shard needs, so shards can be decrypted in any order or at the same time.
+    :param data: Encrypted bytes, as a memoryview.
+    :param key: Bytes
+    :param IV: Initialization Vector.
+    :param result: Writable buffer the same length as data.
+    :param start: Offset of the first block, a multiple of BLOCK_SIZE.
+    :param end: Offset after the last block, a multiple of BLOCK_SIZE.
+    '''
+    out = memoryview(result)[start:end]
+    aes_cipher(bytes(key)).decrypt(data[start:end], output=out)
 
-    # xor with IV
-    xor_block = xor.fixed_xor(decrypt_block, IV)
-    # print(xor_block, len(xor_block), type(xor_block))
-    result = xor_block
+    # block i is XORed with ciphertext block i - 1, and the first block with the IV
+    first = IV if start == 0 else data[start - BLOCK_SIZE:start]
+    strxor(out[:BLOCK_SIZE], first, output=out[:BLOCK_SIZE])
+    strxor(out[BLOCK_SIZE:], data[start:end - BLOCK_SIZE], output=out[BLOCK_SIZE:])
 
-    prev_cipher_block = cipher_block
-    # while more data:
-    for cipher_block in all_blocks[1:]:
-        decrypt_block = aes_cipher.decrypt(cipher_block)
-        xor_block = xor.fixed_xor(prev_cipher_block, decrypt_block)
-        # print(xor_block, len(xor_block))
-        result += xor_block
-        prev_cipher_block = cipher_block
-        # decrypt next block
 
-    # detect and remove PKCS7 padding
-    if result[-1] < BLOCK_SIZE:
-        # how many bytes to remove? BLOCK_SIZE - result[-1]
-        result = result[:-result[-1]]
+class AesEncryptor:
+    '''
+    Incremental AES encryption with standard PKCS#7 padding. update() takes chunks of any size and returns the
+    ciphertext of every whole block so far. A partial block, and for CBC the last ciphertext block, are carried to the
+    next call. finalize() pads and encrypts what is left. Padding is always added, a whole block of it if the
+    plaintext is a whole number of blocks, unlike aes_ecb_encrypt() and aes_cbc_encrypt().
+    '''
 
-    return result
+    def __init__(self, key, mode='ECB', IV=None):
+        '''
+        :param key: Bytes
+        :param mode: 'ECB' or 'CBC', as returned by detect_aes_mode().
+        :param IV: Initialization Vector for CBC. Must be block size (16 bytes default).
+        '''
+        self.key = bytes(key)
+        self.mode = mode
+        self.chain = check_stream_mode(mode, IV)
+        self.pending = bytearray()
+        self.finalized = False
+
+    def update(self, data):
+        '''
+        :param data: Plaintext bytes.
+        :return: Ciphertext bytes, a whole number of blocks (possibly empty).
+        '''
+        if self.finalized:
+            raise ValueError('update() after finalize().')
+        self.pending += data
+        whole = len(self.pending) - len(self.pending) % BLOCK_SIZE
+        with memoryview(self.pending) as view:
+            ciphertext = self.encrypt_blocks(view[:whole])
+        del self.pending[:whole]
+        return ciphertext
+
+    def finalize(self):
+        '''
+        :return: Ciphertext of the last partial block and the padding, one block.
+        '''
+        if self.finalized:
+            raise ValueError('finalize() called twice.')
+        self.finalized = True
+        return self.encrypt_blocks(pkcs7pad(bytes(self.pending), BLOCK_SIZE))
+
+    def encrypt_blocks(self, blocks):
+        if not len(blocks):
+            return b''
+        if self.mode == 'ECB':
+            return aes_cipher(self.key).encrypt(blocks)
+        # a CBC cipher object can't be shared, so each chunk gets a new one starting from the carried block
+        AES = load_aes()
+        ciphertext = AES.new(key=self.key, mode=AES.MODE_CBC, iv=self.chain).encrypt(blocks)
+        self.chain = ciphertext[-BLOCK_SIZE:]
+        return ciphertext
+
+
+class AesDecryptor:
+    '''
+    Incremental AES decryption that strips standard PKCS#7 padding. update() takes chunks of any size and returns the
+    plaintext of every whole block so far except the last one, which may be padding. finalize() decrypts that block,
+    checks the padding and strips it.
+    '''
+
+    def __init__(self, key, mode='ECB', IV=None):
+        '''
+        :param key: Bytes
+        :param mode: 'ECB' or 'CBC', as returned by detect_aes_mode().
+        :param IV: Initialization Vector for CBC. Must be block size (16 bytes default).
+        '''
+        self.key = bytes(key)
+        self.mode = mode
+        self.chain = check_stream_mode(mode, IV)
+        self.pending = bytearray()
+        self.finalized = False
+
+    def update(self, data):
+        '''
+        :param data: Ciphertext bytes.
+        :return: Plaintext bytes, a whole number of blocks (possibly empty).
+        '''
+        if self.finalized:
+            raise ValueError('update() after finalize().')
+        self.pending += data
+        # hold back the last block, or the partial one, until more data or finalize()
+        ready = (len(self.pending) - 1) // BLOCK_SIZE * BLOCK_SIZE if self.pending else 0
+        with memoryview(self.pending) as view:
+            plaintext = self.decrypt_blocks(view[:ready])
+        del self.pending[:ready]
+        return plaintext
+
+    def finalize(self):
+        '''
+        :return: Plaintext of the last block with the padding removed.
+        '''
+        if self.finalized:
+            raise ValueError('finalize() called twice.')
+        self.finalized = True
+        if len(self.pending) != BLOCK_SIZE:
+            raise ValueError('Ciphertext must be a whole number of blocks.', len(self.pending))
+        last_block = self.decrypt_blocks(memoryview(self.pending))
+        padding = last_block[-1]
+        if not 1 <= padding <= BLOCK_SIZE or last_block[-padding:] != bytes([padding]) * padding:
+            raise ValueError('Bad PKCS#7 padding.')
+        return last_block[:-padding]
+
+    def decrypt_blocks(self, blocks):
+        if not len(blocks):
+            return b''
+        plaintext = bytearray(len(blocks))
+        if self.mode == 'ECB':
+            aes_cipher(self.key).decrypt(blocks, output=plaintext)
+        else:
+            aes_cbc_decrypt_shard(blocks, self.key, self.chain, plaintext, 0, len(blocks))
+            self.chain = bytes(blocks[-BLOCK_SIZE:])
+        return bytes(plaintext)
+
+
+def check_stream_mode(mode, IV):
+    # Returns the first CBC chaining value, None for ECB.
+    if mode == 'ECB':
+        return None
+    if mode != 'CBC':
+        raise ValueError("Mode must be 'ECB' or 'CBC'.", mode)
+    if IV is None or len(IV) != BLOCK_SIZE:
+        raise ValueError("IV must be " + str(BLOCK_SIZE) + " bytes.")
+    return bytes(IV)
+
+
+def aes_encrypt_stream(source, sink, key, mode='ECB', IV=None, chunk_size=STREAM_CHUNK_SIZE):
+    '''
+    Encrypt from a file to a file in fixed size chunks with AesEncryptor, so memory use doesn't depend on the input
+    size. Gives the same bytes as AesEncryptor on the whole input.
+    :param source: Readable binary file object, or path of a file.
+    :param sink: Writable binary file object, or path of a file to create.
+    :param key: Bytes
+    :param mode: 'ECB' or 'CBC'.
+    :param IV: Initialization Vector for CBC.
+    :param chunk_size: Bytes per read.
+    :return: Number of bytes written.
+    '''
+    return run_stream(AesEncryptor(key, mode, IV), source, sink, chunk_size)
+
+
+def aes_decrypt_stream(source, sink, key, mode='ECB', IV=None, chunk_size=STREAM_CHUNK_SIZE):
+    '''
+    Decrypt from a file to a file in fixed size chunks with AesDecryptor, so memory use doesn't depend on the input
+    size. Raises ValueError for bad padding, after everything before the last block has been written.
+    :param source: Readable binary file object, or path of a file.
+    :param sink: Writable binary file object, or path of a file to create.
+    :param key: Bytes
+    :param mode: 'ECB' or 'CBC'.
+    :param IV: Initialization Vector for CBC.
+    :param chunk_size: Bytes per read.
+    :return: Number of bytes written.
+    '''
+    return run_stream(AesDecryptor(key, mode, IV), source, sink, chunk_size)
+
+
+def run_stream(cryptor, source, sink, chunk_size):
+    written = 0
+    with ExitStack() as stack:
+        if isinstance(source, (str, bytes, os.PathLike)):
+            source = stack.enter_context(open(source, 'rb'))
+        if isinstance(sink, (str, bytes, os.PathLike)):
+            sink = stack.enter_context(open(sink, 'wb'))
+
+        for chunk in iter(partial(source.read, chunk_size), b''):
+            out = cryptor.update(chunk)
+            sink.write(out)
+            written += len(out)
+        out = cryptor.finalize()
+        sink.write(out)
+        written += len(out)
+    return written
 
 
 def random_aes_key():
@@ -174,16 +426,78 @@ def encrypt_randomly(data, key):
         return aes_cbc_encrypt(data, key, IV)
 
 
+def ecb_block_stats(data):
+    '''
+    Count repeated blocks in one pass with a set. ECB encrypts equal plaintext blocks to equal ciphertext blocks, while
+    repeats in CBC output are as unlikely as in random data. A trailing partial block is ignored.
+    :param data: Encrypted bytes.
+    :return: EcbStats(blocks, duplicates, repetition_ratio). duplicates is the number of blocks equal to an earlier
+    block, repetition_ratio is duplicates / blocks.
+    '''
+    data = bytes(data)
+    blocks = len(data) // BLOCK_SIZE
+    unique = len({data[i:i + BLOCK_SIZE] for i in range(0, blocks * BLOCK_SIZE, BLOCK_SIZE)})
+    duplicates = blocks - unique
+    return EcbStats(blocks, duplicates, duplicates / blocks if blocks else 0.0)
+
+
 def detect_aes_ecb(data):
     '''
     Detects AES ECB by looking for two identical blocks.
     :param data: Encrypted bytes.
-    :return: Bool, true if CBC is detected.
+    :return: Bool, true if ECB is detected.
+    '''
+    return ecb_block_stats(data).duplicates > 0
+
+
+def ecb_stats_lines(numbered_lines):
+    '''
+    Worker for rank_ecb_lines(). ECB statistics of a batch of hex lines.
+    :param numbered_lines: List of (line_number, hex line).
+    :return: List of EcbLineResult.
     '''
-    for combo in itertools.combinations(util.groups(data[:-1], BLOCK_SIZE), 2):
-        if combo[0] == combo[1]:
-            return True
-    return False
+    return [EcbLineResult(line_number, *ecb_block_stats(util.hexbytes_to_bytestr(line)))
+            for line_number, line in numbered_lines]
+
+
+def ecb_rank_key(result):
+    # most repeated blocks first, ties by repetition ratio, then line number
+    return -result.duplicates, -result.repetition_ratio, result.line_number
+
+
+def rank_ecb_lines(source, top_k=None, workers=None, batch_lines=ECB_SCAN_BATCH_LINES):
+    '''
+    Rank the lines of a file of hex ciphertexts by how likely they are to be AES ECB (Set 1, Challenge 8 at scale).
+    Like xor.scan_single_byte_xor(), lines are streamed in batches to a pool of worker processes with a bounded number
+    of batches in flight, so the file is never loaded whole, and with top_k only the best top_k results are kept.
+    :param source: Path of a file, or a binary file object, with one hex ciphertext per line.
+    :param top_k: Number of results to return. None returns every line.
+    :param workers: Number of worker processes. None uses every core, 1 scans in this process.
+    :param batch_lines: Lines per batch sent to a worker.
+    :return: List of EcbLineResult(line_number, blocks, duplicates, repetition_ratio), most repeated blocks first.
+    Line numbers start at 1. Ties are ordered by repetition ratio, then line number.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with ExitStack() as stack:
+        if isinstance(source, (str, bytes, os.PathLike)):
+            source = stack.enter_context(open(source, 'rb'))
+
+        numbered = enumerate(source, start=1)
+        batches = iter(lambda: list(itertools.islice(numbered, batch_lines)), [])
+        if workers <= 1:
+            results = map(ecb_stats_lines, batches)
+        else:
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(max_workers=workers))
+            results = util.bounded_map(executor, ecb_stats_lines, batches, max_pending=workers * 2)
+
+        if top_k is None:
+            return sorted(itertools.chain.from_iterable(results), key=ecb_rank_key)
+        best = []
+        for batch_result in results:
+            best = heapq.nsmallest(top_k, itertools.chain(best, batch_result), key=ecb_rank_key)
+    return best
 
 
 def detect_aes_mode(data):
@@ -209,220 +523,3 @@ def profile_format(email):
 
 def encode_profile(profile):
     return ('email=' + profile['email'] + '&uid=' + profile['uid'] + '&role=' + profile['role']).encode()
-
-
-def test_aes_ecb_encrypt():
-    # Set 1, Challenge 7
-    data = b"Ehrsam, Meyer, Smith and Tuchman invented the Cipher Block Chaining (CBC) mode of operation in 1976."
-    key = 'YELLOW SUBMARINE'
-    ciphertext = aes_ecb_encrypt(data, key)
-    plaintext = aes_ecb_decrypt(ciphertext, key)
-    # print(plaintext)
-    assert plaintext == data
-
-
-def test_aes_ecb_decrypt():
-    # Set 1, Challenge 7
-    # TODO should we strip that padding bytes at the end?
-
-    cipher_file = '7.txt'
-    key = 'YELLOW SUBMARINE'
-
-    with open(cipher_file) as f:
-        text = f.read()
-        # print(text)
-        # print(len(text))
-        text = text.replace('\n', '')
-        # print(text)
-        # print(len(text))
-
-        # ciphertext = base64.b64decode(f.read())  # TODO fix my base_64 code to do this. Some weird parse error
-        ciphertext = base64.b64decode(text)
-
-        # ends with: {~\xaf\x80\xc8p\xedr\xbb\xce\x1f\xff\x8c-\x87
-
-        # ciphertext = base_64.base64_to_bytes(f.read())
-        # ciphertext = base_64.base64_to_bytes(text)
-        # ends with: {~\xaf\x80\xc8p\xedr\xbb\xce\x1f\xff\x8c-\x87
-
-        # lines = ''.join([x.rstrip('\n') for x in f.readlines()])
-        # ciphertext = base_64.base64_to_bytes(lines)
-
-        # print(ciphertext)
-        # print(len(ciphertext))
-
-        aes_cipher = AES.new(key=key, mode=AES.MODE_ECB)
-        plaintext = aes_cipher.decrypt(ciphertext)
-        print()
-        print(plaintext)
-
-        print(aes_ecb_decrypt(ciphertext, key))
-
-
-def test_detect_aes_ecb():
-    # Set 1, Challenge 8
-    # 16 byte blocks
-    with open("8.txt") as f:
-        lines = f.readlines()
-        for index, line in enumerate(lines):
-            for combo in itertools.combinations(util.groups(util.hexbytes_to_bytestr(line[:-1]), 16), 2):
-                if combo[0] == combo[1]:
-                    print(index, line)
-        print(lines)
-    assert detect_aes_ecb(lines[132])
-
-
-def test_pkcs7_padding():
-    # Set 2, Challenge 9
-    assert pkcs7pad(b"YELLOW SUBMARINE", 20) == b"YELLOW SUBMARINE\x04\x04\x04\x04"
-
-
-def test_aes_cbc_encrypt():
-    # Set 2, Challenge 10
-    data = b"Ehrsam, Meyer, Smith and Tuchman invented the Cipher Block Chaining (CBC) mode of operation in 1976."
-    key = b'YELLOW SUBMARINE'
-    IV = bytearray([1 for i in range(16)])
-    encrypted_data = aes_cbc_encrypt(data, key, IV)
-    decrypted_data = aes_cbc_decrypt(encrypted_data, key, IV)
-    # print(data)
-    # print(decrypted_data)
-    assert data == decrypted_data
-
-
-def test_aes_cbc_decrypt():
-    # Set 2, Challenge 10
-    file = '10.txt'
-    key = b'YELLOW SUBMARINE'
-    IV = bytearray([0 for i in range(16)])
-
-    with open(file) as f:
-        ciphertext = base64.b64decode(f.read())  # TODO use my base_64 for this
-        print(type(ciphertext))
-
-    plaintext = aes_cbc_decrypt(ciphertext, key, IV)
-    print(plaintext.decode())
-
-
-def test_random_aes_key():
-    print(random_aes_key())
-    print(type(random_aes_key()))
-
-
-def test_encrypt_randomly():
-    # Set 2, Challenge 11
-    # plaintext = b"This is only a test. Please keep your seats in the upright and locked position. Prepare for landing."
-    # plaintext = b"AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"  # before padding, min length of repeating char is 32 for 2 blocks of 16
-    plaintext = b"DEADBEEFISSOGOODDEADBEEFISSOGOODDEADBEEFISSOGOODDEADBEEFISSOGOOD"  # or same 16 char must repeat
-    unknown_crypto = encrypt_randomly(plaintext, random_aes_key())
-    # print(unknown_crypto)
-    # print(len(unknown_crypto))
-    # print(detect_aes_cbc(unknown_crypto))
-
-    count = 0
-    for i in range(10000):
-        unknown_crypto = encrypt_randomly(plaintext, random_aes_key())
-        if detect_aes_ecb(unknown_crypto):
-            count += 1
-            print(True)
-    print('count:', count)
-    # print(detect_aes_mode(unknown_crypto))
-
-
-def test_decrypt_ecb_byte_at_time():
-    # Set 2, Challenge 12
-
-    my_str = b'A'
-    unknown_str = 'Um9sbGluJyBpbiBteSA1LjAKV2l0aCBteSByYWctdG9wIGRvd24gc28gbXkgaGFpciBjYW4gYmxvdwpUaGUgZ2lybGllcyBvbiBzdGFuZGJ5IHdhdmluZyBqdXN0IHRvIHNheSBoaQpEaWQgeW91IHN0b3A/IE5vLCBJIGp1c3QgZHJvdmUgYnkK'
-
-    print(base64.b64decode(unknown_str))
-    print(len(base64.b64decode(unknown_str)))
-
-    random_key = random_aes_key()
-
-    # detect block size
-    # print('unknown_str', len(base64.b64decode(unknown_str)))
-    low = len(aes_ecb_encrypt(base64.b64decode(unknown_str), random_key))
-    detected_block_length = 0
-    for i in range(50):
-        ciphertext = aes_ecb_encrypt(my_str * i + base64.b64decode(unknown_str), random_key)
-        # print(ciphertext)
-        if len(ciphertext) > low:
-            print(len(ciphertext) - low)
-            detected_block_length = len(ciphertext) - low
-            break
-        # print(len(ciphertext))
-    print('Detected block size:', detected_block_length)
-
-    # detect ECB
-    assert detect_aes_ecb(aes_ecb_encrypt(my_str * 40 + base64.b64decode(unknown_str), random_key))
-
-    plaintext = b''
-
-    for block in range((len(base64.b64decode(unknown_str)) // detected_block_length) + 1):
-        for position in range(detected_block_length, 0, -1):
-            short_block = b'A' * (position - 1)
-            print('1. block:', block, 'short_block:', short_block, 'length:', len(short_block))
-            known_crypt = b''
-
-            # build lookup table for unknown last character
-            lastchar_dict = {}
-            for i in range(256):
-                my_str = short_block + plaintext + chr(i).encode()
-                # print('2. my_str', my_str)
-                lastchar_dict[aes_ecb_encrypt(my_str, random_key)[
-                              detected_block_length * block:detected_block_length * (block + 1)]] = chr(i)
-
-            # print('3. lastchar_dict')
-            # pprint(lastchar_dict)
-            # print('length lastchar_dict:', len(lastchar_dict))
-
-            # print('4. plaintext before oracle:', short_block + base64.b64decode(unknown_str), 'length:',
-            #       len(short_block + base64.b64decode(unknown_str)))
-
-            crypt_block = aes_ecb_encrypt(short_block + base64.b64decode(unknown_str), random_key)[
-                          detected_block_length * block:detected_block_length * (block + 1)]
-            print('5. crypt_block:', crypt_block, 'len(crypt_block):', len(crypt_block))
-
-            # if last byte of block is \x01, padding may be in use
-            if lastchar_dict[crypt_block] == '\x01':
-                print('Possible padding detected by last character.')
-                break
-            try:
-                print('6. char:', lastchar_dict[crypt_block], ord(lastchar_dict[crypt_block]), 'type:',
-                      type(lastchar_dict[crypt_block]))
-            except KeyError as ke:
-                print('Possible padding detected by KeyError.')
-                print(ke)
-                break
-
-            plaintext += lastchar_dict[crypt_block].encode()
-            print('7. plaintext solved', plaintext, 'len(plaintext)', len(plaintext))
-
-        print('8. plaintext:', plaintext)
-    assert plaintext == b"Rollin' in my 5.0\nWith my rag-top down so my hair can blow\nThe girlies on standby waving just to say hi\nDid you stop? No, I just drove by\n"
-    assert plaintext == base64.b64decode(unknown_str)
-
-
-def test_ecb_cut_and_paste():
-    # Set 2, Challenge 13
-    c = parse_cookie('foo=bar&baz=qux&zap=zazzle')
-    print(c)
-    print(profile_format('foo@bar.com'))
-    print(profile_format('foo@bar.com&role=admin'))
-    print(encode_profile(profile_format('foo@bar.com')))
-
-    key = random_aes_key()
-
-    cipher = aes_ecb_encrypt(encode_profile(profile_format('foo@bar.com')), key)
-    plain = parse_cookie(aes_ecb_decrypt(cipher, key).decode())
-    print(plain)
-
-    # make a role=admin profile
-    attack = b'email=foo@bar.com&uid=10&role=admin'
-    attack_cipher = aes_ecb_encrypt(attack, key)
-
-    attack_cipher = attack_cipher[BLOCK_SIZE:]
-    # print(attack_cipher, len(attack_cipher))
-
-    attack_cipher = cipher[:BLOCK_SIZE] + attack_cipher
-    print(aes_ecb_decrypt(attack_cipher, key))
@@ -0,0 +1,148 @@
+# Lightweight instrumentation for the hot paths: call counts, cumulative time and bytes processed per function.
+#
+# Instrumented functions are marked with @probe. While instrumentation is off the decorator leaves the function
+# untouched, so there is no cost at all. Turning it on swaps the module attribute for a counting wrapper, and turning
+# it off puts the original back.
+#
+# Turn it on for a whole run with an environment variable:
+#   CRYPTOPALS_INSTRUMENT=1 python -m pytest xor.py
+# or around a block of code:
+#   with instrument.enabled():
+#       xor.break_repeating_key_xor(cipher)
+#   print(instrument.to_json())
+#
+# Times are inclusive, so a function's time includes the instrumented functions it calls.
+
+# standard library imports
+import json
+import os
+import sys
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+ENV_VAR = 'CRYPTOPALS_INSTRUMENT'
+
+# True while the wrappers are installed.
+is_enabled = os.environ.get(ENV_VAR, '') not in ('', '0')
+
+Probe = namedtuple('Probe', 'module name original wrapper')
+
+# Every @probe function, in the order they were defined.
+probes = []
+
+# Counters by function name, ie. 'xor.fixed_xor'.
+stats = {}
+
+
+class Stats:
+    __slots__ = ('calls', 'seconds', 'bytes')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+
+def probe(func):
+    '''
+    Decorator for functions to instrument. The length of the first argument, if it has one, is counted as the bytes
+    processed by the call. If func has a .score_many, the wrapper gets one that counts every candidate as a call.
+    :param func: Module level function.
+    :return: func, or its counting wrapper if instrumentation is already on.
+    '''
+    name = func.__module__ + '.' + func.__name__
+    counters = stats.setdefault(name, Stats())
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            counters.seconds += perf_counter() - start
+            counters.calls += 1
+            if args:
+                try:
+                    counters.bytes += len(args[0])
+                except TypeError:
+                    pass
+
+    # a batched scorer (see util.batched()) counts each candidate of a batch as one call
+    score_many_func = getattr(func, 'score_many', None)
+    if score_many_func is not None:
+        @wraps(score_many_func)
+        def score_many_wrapper(candidates):
+            start = perf_counter()
+            try:
+                return score_many_func(candidates)
+            finally:
+                counters.seconds += perf_counter() - start
+                counters.calls += len(candidates)
+                counters.bytes += sum(map(len, candidates))
+
+        wrapper.score_many = score_many_wrapper
+
+    probes.append(Probe(func.__module__, func.__name__, func, wrapper))
+    return wrapper if is_enabled else func
+
+
+def enable():
+    '''
+    Install the counting wrappers on every @probe function.
+    '''
+    global is_enabled
+    is_enabled = True
+    for module, name, original, wrapper in probes:
+        setattr(sys.modules[module], name, wrapper)
+
+
+def disable():
+    '''
+    Put the original functions back. Counters are kept until reset().
+    '''
+    global is_enabled
+    is_enabled = False
+    for module, name, original, wrapper in probes:
+        setattr(sys.modules[module], name, original)
+
+
+@contextmanager
+def enabled(reset_counters=False):
+    '''
+    Instrument the code in a with block. Instrumentation is left the way it was found afterwards.
+    :param reset_counters: Zero the counters first.
+    '''
+    was_enabled = is_enabled
+    if reset_counters:
+        reset()
+    enable()
+    try:
+        yield stats
+    finally:
+        if not was_enabled:
+            disable()
+
+
+def reset():
+    for counters in stats.values():
+        counters.calls = 0
+        counters.seconds = 0.0
+        counters.bytes = 0
+
+
+def snapshot():
+    '''
+    Current counters for every function that has been called.
+    :return: Dict of name: dict of calls, seconds, bytes and bytes_per_second.
+    '''
+    return {name: {'calls': counters.calls,
+                   'seconds': counters.seconds,
+                   'bytes': counters.bytes,
+                   'bytes_per_second': counters.bytes / counters.seconds if counters.seconds else 0.0}
+            for name, counters in sorted(stats.items()) if counters.calls}
+
+
+def to_json(**kwargs):
+    return json.dumps(snapshot(), **kwargs)
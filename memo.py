@@ -0,0 +1,306 @@
+# Memoization of the cracking results, so the same ciphertext isn't broken twice.
+#
+# Functions marked with @memoized are keyed by a hash of the function name, the ciphertext and the other arguments.
+# Results are kept in an in-memory LRU of MAX_ENTRIES entries, and optionally in a SQLite file that lasts across
+# runs. It is off by default, so benchmarks and tests time the real work, and costs one flag check per call while off.
+#
+# Turn it on for a whole run with environment variables:
+#   CRYPTOPALS_MEMO=1 CRYPTOPALS_MEMO_DB=memo.sqlite python bench.py
+# or around a block of code:
+#   with memo.enabled(path='memo.sqlite'):
+#       xor.break_repeating_key_xor(cipher)
+#   print(memo.snapshot())
+#
+# Only arguments that identify a result are hashed: None, bool, int, float, str, bytes-like objects, module level
+# functions and tuples of those. Calls with anything else (lambdas, bound methods, open files, ...) are run without
+# the cache. Cached results are shared between callers, so don't modify them.
+
+# standard library imports
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from itertools import chain
+
+ENV_VAR = 'CRYPTOPALS_MEMO'
+DB_ENV_VAR = 'CRYPTOPALS_MEMO_DB'
+
+# Entries, and bytes of arguments, kept in memory before the least recently used entries are dropped. Results like
+# SingleByteXorCandidate keep the ciphertext and a plaintext is as long as its ciphertext, so the bytes-like arguments
+# of a call are taken as the size of its result.
+MAX_ENTRIES = 1024
+MAX_BYTES = 1 << 26
+
+# Part of every key. Change it when a memoized function's results change, so old entries on disk are not used.
+KEY_VERSION = b'2'
+
+# True while results are cached.
+is_enabled = os.environ.get(ENV_VAR, '') not in ('', '0')
+
+# In-memory tier, key: (result, size), most recently used last. cache_bytes is the sum of the sizes.
+cache = OrderedDict()
+cache_bytes = 0
+lock = threading.Lock()
+
+# Disk tier. The SQLite file is opened on the first lookup after enable(path) or with CRYPTOPALS_MEMO_DB set.
+db_path = os.environ.get(DB_ENV_VAR) or None
+db = None
+
+# Counters by function name, ie. 'xor.rank_xor_key_lengths'.
+stats = {}
+
+
+class Stats:
+    __slots__ = ('hits', 'disk_hits', 'misses', 'uncached')
+
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+
+class Uncacheable(Exception):
+    pass
+
+
+def hash_value(hasher, value):
+    # Type tags and lengths keep different argument lists from hashing the same bytes.
+    if value is None or isinstance(value, (bool, int, float)):
+        hasher.update(b'v%r;' % value)
+    elif isinstance(value, str):
+        data = value.encode()
+        hasher.update(b's%d:' % len(data))
+        hasher.update(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        hasher.update(b'b%d:' % len(value))
+        hasher.update(value)
+    elif isinstance(value, tuple):
+        hasher.update(b't%d:' % len(value))
+        for item in value:
+            hash_value(hasher, item)
+    elif callable(value) and '<' not in getattr(value, '__qualname__', '<') and \
+            isinstance(getattr(value, '__self__', None), (type(None), type(os))):
+        # module level functions are identified by name, lambdas and nested functions have '<' in their qualname
+        # a bound method's result depends on its instance, so only builtins bound to their module are named
+        hasher.update(('f%s.%s;' % (value.__module__, value.__qualname__)).encode())
+    else:
+        raise Uncacheable(type(value))
+
+
+def argument_bytes(args, kwargs):
+    # Size of a call's bytes-like arguments, the size charged for its cached result.
+    return sum(len(value) for value in chain(args, kwargs.values())
+               if isinstance(value, (bytes, bytearray, memoryview, str)))
+
+
+def make_key(name, args, kwargs, ignore=()):
+    '''
+    Hash a call. Positional and keyword arguments are hashed as given, so f(x, 3) and f(x, n=3) are different keys.
+    :param name: Function name, ie. 'xor.rank_xor_key_lengths'.
+    :param args: Tuple of positional arguments.
+    :param kwargs: Dict of keyword arguments.
+    :param ignore: Names of keyword arguments that don't change the result, ie. 'workers'.
+    :return: Bytes, or None if an argument can't be hashed.
+    '''
+    hasher = hashlib.blake2b(KEY_VERSION + b'|' + name.encode(), digest_size=20)
+    try:
+        hash_value(hasher, args)
+        for kw in sorted(kwargs):
+            if kw not in ignore:
+                hasher.update(b'k' + kw.encode() + b'=')
+                hash_value(hasher, kwargs[kw])
+    except Uncacheable:
+        return None
+    return hasher.digest()
+
+
+def memoized(ignore=()):
+    '''
+    Decorator for functions whose result only depends on their arguments. Goes under @probe, so instrumented call
+    counts include cache hits.
+    :param ignore: Names of keyword arguments left out of the key, ie. ('workers',).
+    :return: Decorator.
+    '''
+    def decorator(func):
+        name = func.__module__ + '.' + func.__name__
+        counters = stats.setdefault(name, Stats())
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled:
+                return func(*args, **kwargs)
+            key = make_key(name, args, kwargs, ignore)
+            if key is None:
+                counters.uncached += 1
+                return func(*args, **kwargs)
+
+            found, result = lookup(key)
+            if found:
+                counters.hits += 1
+                return result
+            found, result = lookup_db(key)
+            if found:
+                counters.disk_hits += 1
+                store(key, result, argument_bytes(args, kwargs))
+                return result
+
+            counters.misses += 1
+            result = func(*args, **kwargs)
+            store(key, result, argument_bytes(args, kwargs))
+            store_db(key, result)
+            return result
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def lookup(key):
+    with lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return True, cache[key][0]
+    return False, None
+
+
+def store(key, result, size):
+    global cache_bytes
+    if size > MAX_BYTES:
+        # too big to keep in memory, the disk tier still has it
+        return
+    with lock:
+        if key in cache:
+            cache_bytes -= cache.pop(key)[1]
+        cache[key] = (result, size)
+        cache_bytes += size
+        while len(cache) > MAX_ENTRIES or cache_bytes > MAX_BYTES:
+            cache_bytes -= cache.popitem(last=False)[1][1]
+
+
+def open_db():
+    # sqlite3 and pickle are only imported when the disk tier is used
+    global db
+    if db is None and db_path:
+        import sqlite3
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.execute('CREATE TABLE IF NOT EXISTS memo (key BLOB PRIMARY KEY, result BLOB NOT NULL)')
+        db.commit()
+    return db
+
+
+def lookup_db(key):
+    with lock:
+        if open_db() is None:
+            return False, None
+        row = db.execute('SELECT result FROM memo WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return False, None
+    import pickle
+    return True, pickle.loads(row[0])
+
+
+def store_db(key, result):
+    import pickle
+    with lock:
+        if open_db() is None:
+            return
+        db.execute('INSERT OR REPLACE INTO memo (key, result) VALUES (?, ?)',
+                   (key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)))
+        db.commit()
+
+
+def close_db():
+    global db
+    with lock:
+        if db is not None:
+            db.close()
+            db = None
+
+
+def use_db(path):
+    global db_path
+    if path != db_path:
+        close_db()
+        db_path = path
+
+
+def enable(path=None):
+    '''
+    Start caching results.
+    :param path: SQLite file for the disk tier, created if it doesn't exist. None keeps the current one, if any.
+    '''
+    global is_enabled
+    if path is not None:
+        use_db(path)
+    is_enabled = True
+
+
+def disable():
+    '''
+    Stop caching results and close the disk tier. Cached entries and counters are kept until clear() and reset().
+    '''
+    global is_enabled
+    is_enabled = False
+    use_db(None)
+
+
+@contextmanager
+def enabled(path=None, reset_counters=False):
+    '''
+    Cache results in a with block. Caching is left the way it was found afterwards.
+    :param path: See enable().
+    :param reset_counters: Zero the counters first.
+    '''
+    was_enabled, old_path = is_enabled, db_path
+    if reset_counters:
+        reset()
+    enable(path)
+    try:
+        yield stats
+    finally:
+        if not was_enabled:
+            disable()
+        elif path is not None:
+            use_db(old_path)
+
+
+def clear(disk=False):
+    '''
+    Drop every cached result from memory.
+    :param disk: Also delete everything in the disk tier.
+    '''
+    global cache_bytes
+    with lock:
+        cache.clear()
+        cache_bytes = 0
+        if disk and open_db() is not None:
+            db.execute('DELETE FROM memo')
+            db.commit()
+
+
+def reset():
+    for counters in stats.values():
+        counters.hits = 0
+        counters.disk_hits = 0
+        counters.misses = 0
+        counters.uncached = 0
+
+
+def snapshot():
+    '''
+    Current counters for every function that has been called while caching was on.
+    :return: Dict of name: dict of hits, disk_hits, misses, uncached and hit_rate (memory and disk hits over lookups).
+    '''
+    result = {}
+    for name, counters in sorted(stats.items()):
+        lookups = counters.hits + counters.disk_hits + counters.misses
+        if lookups or counters.uncached:
+            result[name] = {'hits': counters.hits,
+                            'disk_hits': counters.disk_hits,
+                            'misses': counters.misses,
+                            'uncached': counters.uncached,
+                            'hit_rate': (counters.hits + counters.disk_hits) / lookups if lookups else 0.0}
+    return result
@@ -0,0 +1,51 @@
+# Tests for bench.py.
+
+# standard library imports
+import os
+import subprocess
+import sys
+
+# external library imports
+import pytest
+
+# local code imports
+from bench import IMPORT_BUDGET_ENV_VAR, IMPORT_BUDGETS, compare, import_time, load, main, over_budget, run, save
+
+
+def test_compare():
+    baseline = {'a': 1.0, 'b': 1.0, 'gone': 1.0}
+    assert compare({'a': 1.2, 'b': 0.5, 'new': 9.0}, baseline, threshold=0.25) == []
+    assert compare({'a': 1.3, 'b': 0.5}, baseline, threshold=0.25) == [('a', 1.0, 1.3)]
+
+
+def test_run(tmp_path):
+    results = run(['fixed_xor[16]'], min_time=0.001, repeats=1, report=None)
+    assert list(results) == ['fixed_xor[16]']
+
+    path = str(tmp_path / 'baseline.json')
+    save(path, results)
+    assert load(path) == results
+    assert main(['--filter', 'fixed_xor[16]', '--min-time', '0.001', '--compare', path, '--threshold', '100']) == 0
+
+
+def test_import_budget_check():
+    # structure only, the real budgets are wall clock times and are checked by python bench.py
+    assert over_budget({'import[util]': 10.0, 'import[xor]': 0.0, 'other': 10.0}) == \
+        [('util', IMPORT_BUDGETS['util'], 10.0)]
+    assert over_budget({}) == []
+    assert import_time('util', repeats=1) > 0
+
+
+@pytest.mark.skipif(not os.environ.get(IMPORT_BUDGET_ENV_VAR), reason='set %s=1 to check import times' %
+                    IMPORT_BUDGET_ENV_VAR)
+def test_import_budget():
+    results = run(['import['], repeats=2, report=None)
+    assert sorted(results) == sorted('import[%s]' % module for module in IMPORT_BUDGETS)
+    assert over_budget(results) == []
+
+
+def test_import_is_lazy():
+    # pytest, the AES backend and the process pool are only imported when they're used
+    code = 'import sys, block, xor, base_64; print(sorted({"pytest", "Crypto", "multiprocessing"} & set(sys.modules)))'
+    assert subprocess.check_output([sys.executable, '-c', code], text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__))).strip() == '[]'
@@ -0,0 +1,48 @@
+# Tests for instrument.py.
+
+# standard library imports
+import json
+
+# local code imports
+import instrument
+from instrument import enabled, reset, snapshot, to_json
+
+
+def test_instrument():
+    import xor
+
+    was_enabled = instrument.is_enabled
+    original = xor.fixed_xor
+    with enabled(reset_counters=True):
+        if not was_enabled:
+            assert xor.fixed_xor is not original
+        xor.fixed_xor(b'abcd', b'efgh')
+        xor.repeating_key_xor(b'abcdef', b'k')
+    assert xor.fixed_xor is original
+
+    counters = snapshot()['xor.fixed_xor']
+    assert counters['calls'] == 2
+    assert counters['bytes'] == 10
+    assert counters['seconds'] > 0
+    assert json.loads(to_json())['xor.fixed_xor']['calls'] == 2
+
+    # nothing is counted while disabled
+    if not was_enabled:
+        xor.fixed_xor(b'abcd', b'efgh')
+        assert snapshot()['xor.fixed_xor']['calls'] == 2
+
+    reset()
+    assert 'xor.fixed_xor' not in snapshot()
+
+
+def test_instrument_score_many():
+    import xor
+
+    with enabled(reset_counters=True):
+        xor.decode_all_single_byte_xor(b'Cooking MCs like a pound of bacon')
+    counters = snapshot()
+    assert counters['xor.decode_all_single_byte_xor']['calls'] == 1
+    # the 256 candidates were scored in one batch, each counted as a call
+    assert counters['util.plaintext_score_diff_from_norm']['calls'] == 256
+    assert counters['util.plaintext_score_diff_from_norm']['bytes'] == 256 * 33
+    reset()
@@ -0,0 +1,90 @@
+# Tests for memo.py.
+
+# local code imports
+import memo
+import util
+import xor
+from memo import enabled, make_key, snapshot
+
+
+def test_make_key():
+    cipher = b'\x01\x02\x03'
+    key = make_key('xor.f', (cipher,), {'top_k': 3})
+    assert key == make_key('xor.f', (bytearray(cipher),), {'top_k': 3})
+    assert key != make_key('xor.g', (cipher,), {'top_k': 3})
+    assert key != make_key('xor.f', (cipher,), {'top_k': 4})
+    assert key != make_key('xor.f', (cipher, 3), {})
+    assert make_key('xor.f', (cipher,), {'workers': 1}, ignore=('workers',)) == make_key('xor.f', (cipher,), {})
+    assert make_key('xor.f', (cipher,), {'scoring_func': util.plaintext_score}) != \
+        make_key('xor.f', (cipher,), {'scoring_func': util.plaintext_score_ngram})
+    assert make_key('xor.f', (cipher,), {'scoring_func': lambda text: 0}) is None
+    # bound methods depend on their instance's state
+    assert make_key('xor.f', (cipher,), {'scoring_func': util.LetterScorer().diff_from_norm}) is None
+    assert make_key('xor.f', (cipher,), {'scoring_func': len}) is not None
+
+
+def test_memoized(tmp_path):
+    cipher = xor.repeating_key_xor(b'Cooking MCs like a pound of bacon, a sound so sweet. ' * 8, b'ICE')
+    expected = xor.break_repeating_key_xor(cipher, workers=1)
+    path = str(tmp_path / 'memo.sqlite')
+
+    memo.clear()
+    with enabled(path=path, reset_counters=True):
+        assert xor.break_repeating_key_xor(cipher, workers=1) == expected
+        assert xor.break_repeating_key_xor(bytearray(cipher), workers=2) is \
+            xor.break_repeating_key_xor(cipher, workers=1)
+        counters = snapshot()['xor.break_repeating_key_xor']
+        assert (counters['hits'], counters['misses'], counters['hit_rate']) == (2, 1, 2 / 3)
+        assert snapshot()['xor.rank_xor_key_lengths']['misses'] == 1
+
+    # nothing is cached while disabled
+    was_enabled, old_path = memo.is_enabled, memo.db_path
+    memo.disable()
+    try:
+        xor.break_repeating_key_xor(cipher, workers=1)
+        assert snapshot()['xor.break_repeating_key_xor']['hits'] == 2
+    finally:
+        if was_enabled:
+            memo.enable(old_path)
+
+    # with the memory tier emptied, results come from the disk tier
+    memo.clear()
+    with enabled(path=path, reset_counters=True):
+        assert xor.break_repeating_key_xor(cipher, workers=1) == expected
+        assert snapshot()['xor.break_repeating_key_xor']['disk_hits'] == 1
+        memo.clear(disk=True)
+        xor.break_repeating_key_xor(cipher, workers=1)
+        assert snapshot()['xor.break_repeating_key_xor']['misses'] == 1
+
+
+def test_lru(monkeypatch):
+    monkeypatch.setattr(memo, 'MAX_ENTRIES', 2)
+    # dropped entries must not come back from a disk tier set up by CRYPTOPALS_MEMO_DB
+    monkeypatch.setattr(memo, 'db_path', None)
+    monkeypatch.setattr(memo, 'db', None)
+    memo.clear()
+    with enabled(reset_counters=True):
+        for cipher in [b'abcd', b'efgh', b'abcd', b'ijkl', b'efgh']:
+            xor.decode_all_single_byte_xor(cipher, top_k=1)
+    counters = snapshot()['xor.decode_all_single_byte_xor']
+    # efgh was the least recently used when ijkl came in
+    assert (counters['hits'], counters['misses']) == (1, 4)
+    assert len(memo.cache) == 2
+    memo.clear()
+
+
+def test_max_bytes(monkeypatch):
+    # entries are charged the size of their ciphertext
+    monkeypatch.setattr(memo, 'MAX_BYTES', 100)
+    monkeypatch.setattr(memo, 'db_path', None)
+    monkeypatch.setattr(memo, 'db', None)
+    memo.clear()
+    with enabled(reset_counters=True):
+        for cipher in [b'a' * 40, b'b' * 40, b'c' * 40, b'd' * 200, b'c' * 40]:
+            xor.decode_all_single_byte_xor(cipher, top_k=1)
+    counters = snapshot()['xor.decode_all_single_byte_xor']
+    assert (counters['hits'], counters['misses']) == (1, 4)
+    # a was dropped to fit c, d was never kept
+    assert (len(memo.cache), memo.cache_bytes) == (2, 80)
+    memo.clear()
+    assert memo.cache_bytes == 0
@@ -0,0 +1,328 @@
+# Tests for util.py.
+
+# standard library imports
+import os
+import sys
+
+# external library imports
+import pytest
+
+# local code imports
+import util
+from util import (
+    DICTIONARY_FILE, DICTIONARY_INDEX_SUFFIX, NGRAM_CACHE_SUFFIX, DictionaryIndex, HexDecoder, LetterScorer,
+    NgramScorer, ScoredPlaintext, WordMatcher, byte_histogram, bytestr_to_hexbytes, columns, exact_groups,
+    group_views, groups, hexbytes_to_bytestr, letter_freq, letter_table, load_dict, load_dict_index,
+    load_ngram_scorer, merge_top_k, parallel_map, plaintext_score, plaintext_score_complex, plaintext_score_dict,
+    plaintext_score_diff_from_norm, plaintext_score_diff_from_norm_histogram, plaintext_score_historgram,
+    plaintext_score_historgram_histogram, plaintext_score_ngram, score_many, top_k_scored)
+
+
+def test_groups():
+    data = 'abcde'
+    for pair in groups(data, 2):
+        print(pair)
+
+    pair_list = [pairs for pairs in groups(data, 2)]
+    assert pair_list == ['ab', 'cd', 'e']
+
+    data = b'abcde'
+    for pair in groups(data, 2):
+        print(pair)
+
+    pair_list = [pairs for pairs in groups(data, 2)]
+    assert pair_list == [b'ab', b'cd', b'e']
+
+
+def test_group_views():
+    data = bytes(range(50))
+    for length in [1, 3, 16, 50, 64]:
+        views = list(group_views(data, length))
+        assert [bytes(view) for view in views] == list(groups(data, length))
+        assert all(isinstance(view, memoryview) for view in views)
+
+        blocks, tail = exact_groups(bytearray(data), length)
+        assert all(len(block) == length for block in blocks)
+        assert b''.join(blocks) + tail == data
+        assert len(tail) == len(data) % length
+
+    # views share memory with the buffer
+    buf = bytearray(b'aaaabbbb')
+    blocks, tail = exact_groups(buf, 4)
+    buf[0] = ord('x')
+    assert blocks[0] == b'xaaa' and tail == b''
+    assert list(group_views(b'', 4)) == []
+
+
+def test_columns():
+    data = bytes(range(10))
+    assert columns(data, 3) == [data[0::3], data[1::3], data[2::3]]
+    assert columns(memoryview(data), 1) == [data]
+    assert columns(bytearray(data), 4) == [b'\x00\x04\x08', b'\x01\x05\x09', b'\x02\x06', b'\x03\x07']
+    assert b''.join(columns(data, 20)) == data
+
+
+def test_parallel_map():
+    assert parallel_map(abs, [-3, 2, -1], workers=1) == [3, 2, 1]
+    assert parallel_map(abs, [-3, 2, -1], workers=2) == [3, 2, 1]
+
+
+def test_ScoredPlaintext():
+    sp = ScoredPlaintext(b'abcdef')
+    print(sp)
+    print(sp.score)
+
+    sp2 = ScoredPlaintext(b'\x1b77316?x\x15\x1b\x7f+x413=x9x(7-6<x7>x:9;76', scoring_func=plaintext_score)
+    print(sp2)
+    print(sp2.score)
+    print(plaintext_score_dict("This is a test sentence!".encode()))
+    print(plaintext_score_dict(
+        b'\x0b\n\x0bZ\x0fZ\t_\x0bY\x0b\x02\t\r\x0b\x03\t_\t]\n\x0e\t\x0e\x0e\r\t_\n_\x0b\x0c\x0bZ\x0cZ\x0b\x03\n\x0e\t]\x0eY\x0f\x0f\x08\x03Z\x0f\n\x0e\x0bY\n\x08\t^\t\x0b1'))
+
+
+def test_ScoredPlaintext_diff_from_norm():
+    print(ScoredPlaintext(b'test test test', scoring_func=plaintext_score_diff_from_norm))
+    print(ScoredPlaintext(b'This is only a test.', scoring_func=plaintext_score_diff_from_norm))
+    print(ScoredPlaintext(
+        b'In addition to the usual mapping methods, ordered dictionaries also support reverse iteration using reversed().',
+        scoring_func=plaintext_score_diff_from_norm))
+
+
+def test_ScoredPlaintext_ordering():
+    low = ScoredPlaintext(b'zzz', scoring_func=plaintext_score, key=1)
+    high = ScoredPlaintext(b'the', scoring_func=plaintext_score)
+    assert low < high and high > low and low <= low and high >= low
+    assert max([low, high]) is high
+    assert sorted([high, low]) == [low, high]
+    assert low != ScoredPlaintext(b'zzz', scoring_func=plaintext_score, key=1)
+    assert low.key() == 1 and high.key() is None
+    assert str(low) == "ScoredPlaintext: Key: 1\tScore: %d\tBytestring: b'zzz'" % low.score
+
+    with pytest.raises(AttributeError):
+        low.note = 'no __dict__'
+
+
+def test_ScoredPlaintext_memory():
+    def size(obj):
+        return sys.getsizeof(obj) + (sys.getsizeof(obj.__dict__) if hasattr(obj, '__dict__') else 0)
+
+    # The namedtuple with _score and _key attributes this replaced was about 250 bytes per candidate.
+    assert size(ScoredPlaintext(b'abc', scoring_func=len, key=65)) <= 64
+
+
+def test_letter_scorer():
+    samples = [b"Cooking MC's like a pound of bacon", b'Now that the party is jumping\n', b'  \x00\xff zZ',
+               bytes(range(256)), b'!!!', b'THE AND the and']
+
+    for sample in samples:
+        # per-letter loops the scorers replaced
+        upper = sample.upper()
+        assert plaintext_score(sample) == sum(upper.count(char) * weight for char, weight in letter_table.items())
+
+        score = 0
+        for char in letter_freq.keys():
+            score += abs(letter_freq[char] - (upper.count(char) / len(sample)))
+        score = 100 / score + sum(1 for punc in b'\'.,;?!' if punc in sample)
+        assert plaintext_score_diff_from_norm(sample) == score
+        assert plaintext_score_diff_from_norm_histogram(byte_histogram(sample), len(sample)) == score
+
+        assert plaintext_score_historgram_histogram(byte_histogram(sample), len(sample)) == \
+            plaintext_score_historgram(sample)
+
+    with pytest.raises(ValueError):
+        LetterScorer(table={b'E': 256})
+
+
+def test_plaintext_score_historgram():
+    english = plaintext_score_historgram(b"Cooking MC's like a pound of bacon")
+    assert english > plaintext_score_historgram(b'\x1b77316?x\x15\x1b\x7f+x413=x9x(7-6<x7>x:9;76')
+    assert english > plaintext_score_historgram(b'cOOKING\x00mc\x07S\x00LIKE\x00A\x00POUND\x00OF\x00BACON')
+    assert plaintext_score_historgram(b'') == 100
+
+
+def test_top_k_scored():
+    candidates = [ScoredPlaintext(text, scoring_func=plaintext_score) for text in
+                  [b'zzz', b'the rest', b'eat', b'eta', b'qq']]
+    assert top_k_scored(candidates) == sorted(candidates, key=lambda x: x.score, reverse=True)
+    assert top_k_scored(iter(candidates), 3) == sorted(candidates, key=lambda x: x.score, reverse=True)[:3]
+    # ties keep input order
+    assert [sp.bytestr for sp in top_k_scored(candidates, 3)] == [b'the rest', b'eat', b'eta']
+
+    merged = merge_top_k(([sp] for sp in candidates), top_k=2)
+    assert [sp.bytestr for sp in merged] == [b'the rest', b'eat']
+
+
+def test_load_dict():
+    load_dict(DICTIONARY_FILE)
+    # print(word_set)
+    assert plaintext_score_dict(b'this is only a test') == 5
+    assert 'test' in util.word_set
+
+
+def test_dictionary_index(tmp_path, monkeypatch):
+    word_file = tmp_path / 'words.txt'
+    word_file.write_bytes(b'this\nis\nOnly\na\ntest\n\ntest\ncaf\xc3\xa9\n')
+
+    index = load_dict_index(str(word_file))
+    assert len(index) == 6
+    for word in [b'this', b'is', b'only', b'a', b'test', b'caf\xc3\xa9']:
+        assert word in index
+        assert bytearray(word) in index
+    for word in [b'', b'Only', b'tes', b'tests', b'\xff', b'x' * 1000, b'x' * 0x10000]:
+        assert word not in index
+    assert sorted(index) == [b'a', b'caf\xc3\xa9', b'is', b'only', b'test', b'this']
+
+    # count() remembers its answers, and starts over when it has too many
+    words = [b'this', b'is', b'not', b'a', b'test', b'this', b'x' * 0x10000]
+    assert index.count(words) == 5
+    assert index.cache[b'not'] == 0 and index.cache[b'test'] == 1
+    assert index.count(words) == 5
+    index.CACHE_WORDS = 8
+    assert index.count([b'only', b'tests', b'caf\xc3\xa9', b'is']) == 3
+    assert len(index.cache) == 4
+    assert index.count([]) == 0
+    index.close()
+
+    # the index is reused until the word list changes
+    index_file = str(word_file) + DICTIONARY_INDEX_SUFFIX
+    built = os.path.getmtime(index_file)
+    load_dict_index(str(word_file)).close()
+    assert os.path.getmtime(index_file) == built
+
+    monkeypatch.setattr(util, 'DICTIONARY_FILE', str(word_file))
+    monkeypatch.setattr(util, 'dict_index', None)
+    monkeypatch.setattr(util, 'dict_matcher', None)
+    assert plaintext_score_dict(b'This is only a test') == 5
+    # undecodable bytes don't stop the scan
+    assert plaintext_score_dict(b'\xff\xfe this is') == 2
+    # neither do punctuation and newlines
+    assert plaintext_score_dict(b'This,is\nonly (a) test.') == 5
+    # nor does a token too long for the index
+    assert plaintext_score_dict(b'this ' + b'x' * 70000) == 1
+    # the matcher reads the words from the memory map instead of copying them
+    assert util.dict_matcher.words is util.dict_index
+    assert list(util.dict_matcher.hits(b'a test')) == [(0, 1, 1), (2, 6, 1)]
+
+    with pytest.raises(ValueError):
+        DictionaryIndex(str(word_file))
+
+    # an index in an older format is built again
+    with open(index_file, 'r+b') as f:
+        f.write(b'CPDX\x01\x00\x00\x00')
+    index = load_dict_index(str(word_file))
+    assert b'test' in index
+    index.close()
+
+
+def test_score_many(monkeypatch):
+    monkeypatch.setattr(util, 'dict_matcher', WordMatcher([b'this', b'is', b'a', b'test']))
+    candidates = [b'This is a test, only a test.', bytearray(b'\x00\xff\xfe  x'), memoryview(b'ETAOIN SHRDLU'), b'q',
+                  b'\xc3\xa9t\xc3\xa9']
+    for func in [plaintext_score, plaintext_score_complex, plaintext_score_dict, plaintext_score_historgram,
+                 plaintext_score_diff_from_norm, plaintext_score_ngram]:
+        assert score_many(func, candidates) == [func(bytes(candidate)) for candidate in candidates]
+        assert score_many(func, []) == []
+
+    # functions without a batched version are called on each candidate
+    assert score_many(len, candidates) == [28, 6, 13, 1, 5]
+
+
+def test_ngram_scorer(tmp_path):
+    corpus_file = tmp_path / 'corpus.txt'
+    corpus_file.write_bytes(b'the cat sat on the mat. then the cat ate the rat! ' * 3)
+    cache_file = str(corpus_file) + NGRAM_CACHE_SUFFIX
+
+    scorer = load_ngram_scorer(str(corpus_file))
+    assert os.path.exists(cache_file)
+    assert scorer.score(b'the cat') > scorer.score(b'hte tca') > scorer.score(b'\x00\x9f\xff\x01\xe0\x10\x7f')
+    assert scorer.score(b'the cat') > scorer.score(b'THE CAT')
+    assert scorer.score(b'') == 0
+    assert scorer.score_many([b'the', bytearray(b'rat'), memoryview(b'at')]) == \
+           [scorer.score(b'the'), scorer.score(b'rat'), scorer.score(b'at')]
+
+    # byte frequencies alone still tell case apart
+    assert scorer.histogram_score(byte_histogram(b'the cat')) > scorer.histogram_score(byte_histogram(b'THE CAT'))
+    assert scorer.histogram_score(byte_histogram(b'the cat')) == \
+        scorer.histogram_score(byte_histogram(b'tac eht'))
+
+    # the cached tables give the same scores
+    loaded = NgramScorer.load(cache_file)
+    assert loaded.trigram_logp == scorer.trigram_logp
+    assert loaded.score(b'the mat') == scorer.score(b'the mat')
+    assert loaded.histogram_score(byte_histogram(b'the mat')) == scorer.histogram_score(byte_histogram(b'the mat'))
+
+    # a damaged cache is rebuilt
+    with open(cache_file, 'r+b') as f:
+        f.write(b'XXXX')
+    assert load_ngram_scorer(str(corpus_file)).score(b'the mat') == scorer.score(b'the mat')
+
+    bigrams = NgramScorer.train(corpus_file.read_bytes(), order=2)
+    assert bigrams.score(b'the cat') > bigrams.score(b'hte tca')
+    with pytest.raises(ValueError):
+        NgramScorer.train(b'the', order=4)
+
+
+def test_plaintext_score_ngram():
+    # Too short for plaintext_score_diff_from_norm() to find the key.
+    plaintext = b'Play that funky'
+    cipher = bytes(b ^ 0x5a for b in plaintext)
+    candidates = [bytes(b ^ key for b in cipher) for key in range(256)]
+    scores = score_many(plaintext_score_ngram, candidates)
+    assert candidates[scores.index(max(scores))] == plaintext
+
+
+def test_word_matcher():
+    words = [b'he', b'she', b'his', b'hers', b"'re"]
+    text = b'Ushers, his SHE. Hershey! they\'re'
+
+    matcher = WordMatcher(words, whole_words=False)
+    found = [(text[start:end].lower(), weight) for start, end, weight in matcher.hits(text)]
+    assert sorted(found) == sorted((word, 1) for word in words for _ in range(text.lower().count(word)))
+    assert matcher.score(text) == len(found)
+    assert len(matcher) == 5
+
+    matcher = WordMatcher(words)
+    assert [text[start:end] for start, end, weight in matcher.hits(text)] == [b'his', b'SHE']
+    assert matcher.score(b'he\nhe') == 2
+    assert matcher.score(b'') == 0
+
+    weighted = WordMatcher({b'the': 3, b'an': -1, b'a': 0}, whole_words=False)
+    assert weighted.score(b'THE THEN AN A') == 3 + 3 - 1 + 0
+    assert WordMatcher({b'the': 3, b'an': -1}).score(b'the then an') == 3 - 1
+
+
+def test_hexbytes_to_bytestr():
+    data = bytes(range(256))
+    hexbytes = bytestr_to_hexbytes(data)
+    assert hexbytes_to_bytestr(hexbytes) == data
+    assert hexbytes_to_bytestr(hexbytes.upper()) == data
+    assert hexbytes_to_bytestr(hexbytes.decode()) == data
+    assert hexbytes_to_bytestr(b'DeAd bE\nef\r\n') == b'\xde\xad\xbe\xef'
+    assert hexbytes_to_bytestr(b'ff8') == b'\xff\x08'
+    assert hexbytes_to_bytestr(b'') == b''
+    for bad in [b'0g', b'12 -3', 'é1']:
+        with pytest.raises(ValueError):
+            hexbytes_to_bytestr(bad)
+
+
+def test_hex_decoder():
+    data = os.urandom(1000)
+    hexbytes = b'\n'.join(groups(bytestr_to_hexbytes(data), 61))
+    for chunk_size in [1, 2, 7, 64, len(hexbytes)]:
+        decoder = HexDecoder()
+        decoded = b''.join(decoder.update(chunk) for chunk in groups(hexbytes, chunk_size)) + decoder.finalize()
+        assert decoded == data
+
+    decoder = HexDecoder()
+    assert decoder.update(b'a') == b''
+    assert decoder.update(memoryview(b'bc')) == b'\xab'
+    assert decoder.finalize() == b'\x0c'
+    assert decoder.finalize() == b''
+
+
+def test_bytestr_to_hexbytes():
+    print(bytestr_to_hexbytes(b'AAAA'))
+    assert bytestr_to_hexbytes(b'AAAA') == b'41414141'
+
+    print(bytestr_to_hexbytes(b'\x01'))
+    assert bytestr_to_hexbytes(b'\x01') == b'01'
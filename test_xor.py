@@ -0,0 +1,314 @@
+# Tests for xor.py.
+
+# standard library imports
+import base64
+import io
+import os
+
+# external library imports
+import pytest
+
+# local code imports
+import util
+from xor import (
+    XOR_CHUNK_SIZE, KEY_LENGTH_SAMPLE_WINDOWS, break_repeating_key_xor, decode_all_single_byte_xor,
+    decode_single_byte_xor, decode_single_byte_xor_histogram, expand_str, find_xor_key_length, fixed_xor,
+    hamming_dist, hamming_matrix, key_length_samples, key_length_windows, rank_xor_key_lengths, repeating_key_xor,
+    repeating_key_xor_stream, scan_single_byte_xor, single_byte_xor, xor_key_length_score,
+    xor_key_length_score_samples)
+
+
+def test_fixed_xor():
+    hexstr = b'1c0111001f010100061a024b53535009181c'
+    one = hexstr
+    two = b'686974207468652062756c6c277320657965'
+
+    onebytestr = util.hexbytes_to_bytestr(one)
+    # print(onebytestr)
+    # print(str(onebytestr))
+    # print(len(onebytestr))
+    xor_result = fixed_xor(onebytestr, util.hexbytes_to_bytestr(two))
+    # print('xor_result', xor_result, type(xor_result))
+    answer = b'746865206b696420646f6e277420706c6179'
+    # print('answer', answer)
+    assert xor_result == util.hexbytes_to_bytestr(answer)
+
+
+def test_fixed_xor_buffers():
+    one = bytes(range(256)) * 3
+    two = bytes(reversed(range(256))) * 3
+    expected = bytes(a ^ b for a, b in zip(one, two))
+
+    assert fixed_xor(bytearray(one), memoryview(two)) == expected
+
+    # in-place into one of the inputs
+    out = bytearray(one)
+    assert fixed_xor(out, two, out=out) is out
+    assert out == expected
+
+    # write into a view of a larger buffer
+    big = bytearray(len(one) + 4)
+    fixed_xor(one, two, out=memoryview(big)[2:])
+    assert big[2:-2] == expected
+
+    with pytest.raises(ValueError):
+        fixed_xor(one, two, out=bytearray(10))
+    with pytest.raises(ValueError):
+        fixed_xor(b'ab', b'abc')
+
+    # more than one chunk
+    one = bytes(range(256)) * (XOR_CHUNK_SIZE // 256 + 1) + b'xyz'
+    two = b'\x55' * len(one)
+    assert fixed_xor(one, two) == single_byte_xor(one, b'\x55')
+
+
+def test_singlebyte_xor():
+    cipher_hex_bytes = b'1b37373331363f78151b7f2b783431333d78397828372d363c78373e783a393b3736'
+    cipher_bytestr = util.hexbytes_to_bytestr(cipher_hex_bytes)
+    # print('Test - cipher_bytestr:', cipher_bytestr)
+
+    decode = decode_all_single_byte_xor(cipher_bytestr)[0]
+    # print(decode)
+    assert decode.bytestr == b"Cooking MC's like a pound of bacon"
+
+    top = decode_all_single_byte_xor(cipher_bytestr, top_k=5)
+    assert [sp.key() for sp in top] == [sp.key() for sp in decode_all_single_byte_xor(cipher_bytestr)[:5]]
+    assert top[0].bytestr == decode.bytestr
+
+
+def test_decode_single_byte_xor_histogram():
+    cipher_bytestr = util.hexbytes_to_bytestr(
+        b'1b37373331363f78151b7f2b783431333d78397828372d363c78373e783a393b3736')
+
+    decode = decode_single_byte_xor_histogram(cipher_bytestr)
+    assert len(decode) == 1
+    assert decode[0].bytestr == b"Cooking MC's like a pound of bacon"
+    assert decode[0].score == util.plaintext_score_diff_from_norm(decode[0].bytestr)
+    assert decode_single_byte_xor(cipher_bytestr).bytestr == decode[0].bytestr
+
+    # same ranking and scores as scoring every plaintext
+    brute_force = decode_all_single_byte_xor(cipher_bytestr)
+    histogram = decode_single_byte_xor_histogram(cipher_bytestr, top_k=None)
+    assert [sp.key() for sp in histogram] == [sp.key() for sp in brute_force]
+    assert [sp.score for sp in histogram] == [sp.score for sp in brute_force]
+
+
+def test_scan_single_byte_xor(tmp_path):
+    lines = [util.bytestr_to_hexbytes(xor) for xor in
+             [single_byte_xor(b'qzx jkv wqz xjkq zzvx', b'\x11'),
+              os.urandom(30),
+              single_byte_xor(b'Now that the party is jumping', b'\x35'),
+              os.urandom(30)]]
+    path = tmp_path / 'lines.txt'
+    path.write_bytes(b'\n'.join(lines * 50) + b'\n')
+
+    seen = []
+    results = scan_single_byte_xor(str(path), top_k=4, workers=1, batch_lines=7, progress=seen.append)
+    # the case flipped key 0x15 scores lower, so every repeat of the English line comes first
+    assert [(result.line_number, result.key) for result in results] == [(3, 0x35), (7, 0x35), (11, 0x35), (15, 0x35)]
+    assert results[0].plaintext == b'Now that the party is jumping'
+    assert seen[-1] == 200
+    assert seen == sorted(seen)
+
+    # same output for any number of workers and batch size
+    assert scan_single_byte_xor(str(path), top_k=4, workers=2, batch_lines=3) == results
+    with open(path, 'rb') as f:
+        assert scan_single_byte_xor(f, top_k=4, workers=1) == results
+
+
+def test_scan_single_byte_xor_chall4():
+    # the real Set 1, Challenge 4 file, where letter frequency alone ranks a random line first
+    for workers in [1, 2]:
+        best = scan_single_byte_xor('4.txt', top_k=3, workers=workers, batch_lines=50)[0]
+        assert (best.line_number, best.key, best.plaintext) == (171, 0x35, b'Now that the party is jumping\n')
+
+
+def test_expand_str():
+    assert expand_str('1', 10) == '1111111111'
+    assert expand_str(b'1', 10) == b'1111111111'
+    assert expand_str(b'12', 10) == b'1212121212'
+    assert expand_str(b'12', 11) == b'12121212121'
+
+
+def test_repeating_key_xor_stream(tmp_path):
+    text = bytes(range(256)) * 40 + b'tail'
+    key = b'ICE!!'
+    expected = repeating_key_xor(text, key)
+
+    # file objects, chunk size not a multiple of the key length
+    sink = io.BytesIO()
+    assert repeating_key_xor_stream(io.BytesIO(text), sink, key, chunk_size=7) == len(text)
+    assert sink.getvalue() == expected
+
+    # memory-mapped path to path
+    source_path = tmp_path / 'plain.bin'
+    sink_path = tmp_path / 'cipher.bin'
+    source_path.write_bytes(text)
+    repeating_key_xor_stream(str(source_path), str(sink_path), key, chunk_size=1000)
+    assert sink_path.read_bytes() == expected
+
+    # continue a stream part way through the key
+    sink = io.BytesIO()
+    repeating_key_xor_stream(io.BytesIO(text[:13]), sink, key, chunk_size=4)
+    repeating_key_xor_stream(io.BytesIO(text[13:]), sink, key, chunk_size=64, offset=13)
+    assert sink.getvalue() == expected
+
+    source_path.write_bytes(b'')
+    assert repeating_key_xor_stream(source_path, sink_path, key) == 0
+    assert sink_path.read_bytes() == b''
+
+
+def test_hamming_dist():
+    assert hamming_dist(b'', b'') == 0
+    assert hamming_dist(b'test', b'test') == 0
+    assert hamming_dist(b'a', b'b') == 2
+    assert hamming_dist(b'this is a test', b'wokka wokka!!!') == 37
+    with pytest.raises(TypeError):
+        assert hamming_dist('this is a test', 'wokka wokka!!!') == 37
+    assert hamming_dist(bytearray(b'this is a test'), memoryview(b'wokka wokka!!!')) == 37
+
+
+def test_hamming_matrix():
+    blocks = [b'this is a test', b'wokka wokka!!!', b'this is a tesu']
+    matrix = hamming_matrix(blocks)
+    for i, one in enumerate(blocks):
+        for j, two in enumerate(blocks):
+            assert matrix[i][j] == hamming_dist(one, two)
+    assert matrix[0][1] == 37
+    assert hamming_matrix([]) == []
+    with pytest.raises(ValueError):
+        hamming_matrix([b'ab', b'abc'])
+
+
+def test_find_xor_key_length():
+    with open('6.txt') as f:
+        cipher = base64.b64decode(f.read())
+    assert find_xor_key_length(cipher, 2, 40, 4) == 29
+
+
+def test_rank_xor_key_lengths():
+    with open('6.txt') as f:
+        cipher = base64.b64decode(f.read())
+
+    ranked = rank_xor_key_lengths(cipher, 2, 40)
+    assert len(ranked) == 39
+    assert ranked[0].key_len == 29
+    assert ranked[0].confidence > ranked[1].confidence
+    assert ranked[0].score == xor_key_length_score(cipher, 29)
+
+    # multiples of the key length score about the same, the real length must still win
+    ranked = rank_xor_key_lengths(cipher, 2, 60)
+    assert ranked[0].key_len == 29
+
+    assert rank_xor_key_lengths(cipher, 2, 40, workers=2) == rank_xor_key_lengths(cipher, 2, 40, workers=1)
+
+    # more ciphertext than max_bytes is sampled in windows
+    assert len(key_length_windows(len(cipher) * 40, 29, max_bytes=len(cipher) * 4)) == KEY_LENGTH_SAMPLE_WINDOWS
+    assert rank_xor_key_lengths(cipher * 40, 2, 40, max_bytes=len(cipher) * 4)[0].key_len == 29
+    assert rank_xor_key_lengths(cipher * 40, 2, 40, max_bytes=len(cipher) * 4, workers=2) == \
+        rank_xor_key_lengths(cipher * 40, 2, 40, max_bytes=len(cipher) * 4, workers=1)
+    # only the samples are sent to the workers
+    samples = key_length_samples(cipher * 40, 29, max_bytes=len(cipher) * 4)
+    assert sum(len(sample) for sample in samples) <= len(cipher) * 4
+    assert xor_key_length_score_samples((29, [bytes(sample) for sample in samples])) == \
+        xor_key_length_score(cipher * 40, 29, max_bytes=len(cipher) * 4)
+
+
+###########
+# SOLUTIONS
+def test_solve_set1_chall4():
+    TOP_K = 10
+    line_results = []
+    with open('4.txt') as f:
+        for line in f:
+            converted = util.hexbytes_to_bytestr(line)
+            # The best TOP_K of each line are enough for the overall best TOP_K.
+            # With bytes >= 0x80 decoded correctly, some random lines have letter frequencies closer to English than
+            # the answer does, so the letter order has to be scored too.
+            line_results.append(decode_all_single_byte_xor(converted, top_k=TOP_K,
+                                                           scoring_func=util.plaintext_score_ngram))
+
+        all_plain = util.merge_top_k(line_results, top_k=TOP_K)
+        top_plain = util.merge_top_k(([result[0]] for result in line_results), top_k=TOP_K)
+
+        print("Place : Result (all decoded scores)")
+        for i in range(10):
+            print(str(i) + ':', all_plain[i])
+
+        print("Place : Result (top decoded scores)")
+        for i in range(10):
+            print(str(i) + ':', top_plain[i])
+
+    assert all_plain[0].bytestr == b'Now that the party is jumping\n'
+    assert top_plain[0].bytestr == b'Now that the party is jumping\n'
+    assert all_plain[0].key() == 0x35
+    assert len(line_results) == 327
+
+
+def test_solve_chall5():
+    answer = repeating_key_xor(b'Burning \'em, if you ain\'t quick and nimble\nI go crazy when I hear a cymbal', b'ICE')
+    # print(answer)
+    # print(util.bytestr_to_hexbytes(answer))
+    assert util.bytestr_to_hexbytes(
+        answer) == b'0b3637272a2b2e63622c2e69692a23693a2a3c6324202d623d63343c2a26226324272765272a282b2f20430a652e2c652a3124333a653e2b2027630c692b20283165286326302e27282f'
+
+
+def test_solve_chall6():
+    '''
+    1) Let KEYSIZE be the guessed length of the key; try values from 2 to (say) 40.
+
+    2) Write a function to compute the edit distance/Hamming distance between two strings. The Hamming distance is just
+    the number of differing bits. The distance between:
+        this is a test
+        and
+        wokka wokka!!!
+        is 37. Make sure your code agrees before you proceed.
+
+    3) For each KEYSIZE, take the first KEYSIZE worth of bytes, and the second KEYSIZE worth of bytes, and find the edit
+    distance between them. Normalize this result by dividing by KEYSIZE.
+
+    4) The KEYSIZE with the smallest normalized edit distance is probably the key. You could proceed perhaps with the smallest 2-3 KEYSIZE values. Or take 4 KEYSIZE blocks instead of 2 and average the distances.
+
+    5) Now that you probably know the KEYSIZE: break the ciphertext into blocks of KEYSIZE length.
+
+    6) Now transpose the blocks: make a block that is the first byte of every block, and a block that is the second byte of every block, and so on.
+
+    7) Solve each block as if it was single-character XOR. You already have code to do this.
+
+    8) For each block, the single-byte XOR key that produces the best looking histogram is the repeating-key XOR key byte for that block. Put them together and you have the key.
+    '''
+
+    KEYSIZE_RANGE_MIN = 2  # Inclusive range of possible key sizes to search
+    KEYSIZE_RANGE_MAX = 40
+
+    with open('6.txt') as f:
+        # Un-Base64 AFTER joining, not before
+        # cipher = base_64.base64_to_bytes(cipher_b64) # TODO doesn't match base64 result
+        cipher = base64.b64decode(''.join([x.rstrip('\n') for x in f.readlines()]))
+
+    result = break_repeating_key_xor(cipher, KEYSIZE_RANGE_MIN, KEYSIZE_RANGE_MAX)
+    print(result.key)
+    print(result.plaintext)
+
+    assert result.key == b'Terminator X: Bring the noise'
+    assert result.plaintext.startswith(b"I'm back and I'm ringin' the bell")
+    assert len(result.column_scores) == len(result.key)
+
+    # same answer when the columns are solved in parallel
+    assert break_repeating_key_xor(cipher, KEYSIZE_RANGE_MIN, KEYSIZE_RANGE_MAX, workers=2) == result
+
+
+def test_break_repeating_key_xor_case():
+    # the letter frequency score can't tell a key byte from its case flip, so the columns are scored with case
+    key = b'Terminator X: Bring the noise'
+    with open(util.NGRAM_CORPUS_FILE, 'rb') as f:
+        plaintext = f.read(2000)
+    result = break_repeating_key_xor(repeating_key_xor(plaintext, key), workers=1)
+    assert result.key == key
+    assert result.plaintext == plaintext
+
+    # text the scorer wasn't trained on, with a key that isn't all letters
+    plaintext = (b'Every column of a repeating-key ciphertext is a single-byte xor of every 7th byte of the '
+                 b'plaintext. On its own a column is not English, only its byte frequencies are. ') * 6
+    key = b'\x13Yo\xa0Ke\x7f'
+    assert break_repeating_key_xor(repeating_key_xor(plaintext, key), workers=1).key == key
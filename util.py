@@ -1,12 +1,25 @@
 # Utilities for cryptopals.
 
 # standard library imports
-from collections import namedtuple
-
-# external library imports
-
-# Set True to print logs
-DEBUG = False
+import binascii
+import concurrent.futures
+import heapq
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter, deque
+from itertools import chain, compress, filterfalse, repeat
+from operator import add, and_, attrgetter, getitem, lshift, mul
+
+# local code imports
+from instrument import probe
+
+logger = logging.getLogger(__name__)
 
 # letter_frequency = b'ETAOIN SHRDLU'
 '''
@@ -59,11 +72,28 @@ letter_table = {
     b'U': 3
 }
 
+# Share of English text that is spaces, and that is neither a letter nor a space (punctuation, digits, newlines).
+# The letters make up the rest, split according to letter_freq. Used by the chi-squared histogram scorer.
+space_freq = 0.175
+other_freq = 0.025
+
 # A set of english dictionary words for plaintext_score_dict(). Keeps list in memory instead of loading from file
 # multiple times during exectution.
 word_set = None  # None means the dictionary file hasn't been loaded yet.
 DICTIONARY_FILE = 'MainEnglishDictionary_ProbWL.txt'
 
+# plaintext_score_dict() looks words up in a compact binary index of DICTIONARY_FILE, built once next to it and
+# memory-mapped, so every process shares the same read-only pages instead of loading its own set.
+DICTIONARY_INDEX_SUFFIX = '.idx'
+dict_index = None  # None means the index hasn't been opened yet in this process.
+dict_matcher = None  # WordMatcher over dict_index, made on first use.
+
+# plaintext_score_ngram() uses letter order as well as letter frequencies. Its log-probability tables are trained from
+# NGRAM_CORPUS_FILE and cached in a binary file next to it.
+NGRAM_CORPUS_FILE = 'english_corpus.txt'
+NGRAM_CACHE_SUFFIX = '.ngrams'
+ngram_scorer = None  # None means the tables haven't been loaded yet in this process.
+
 
 def groups(seq, length):
     '''
@@ -80,48 +110,460 @@ def groups(seq, length):
         yield seq[i:i + length]
 
 
+def group_views(buf, length):
+    '''
+    Like groups(), but for bytes-like objects, and each group is a memoryview into buf instead of a copy. The views
+    are made by map() in C, so no Python code runs per group.
+        for block in group_views(data, 16):
+            do_the_thing(block)
+    :param buf: Bytes-like object, like bytes, bytearray, mmap or memoryview.
+    :param length: The length of each group (ie. 16 for AES blocks)
+    :return: Iterator of memoryviews. The last one is shorter if len(buf) isn't a multiple of length.
+    '''
+    data = memoryview(buf).cast('B')
+    return map(data.__getitem__, map(slice, range(0, len(data), length), range(length, len(data) + length, length)))
+
+
+def exact_groups(buf, length):
+    '''
+    Split a bytes-like object into memoryviews of exactly length bytes and a remainder, without copying.
+        blocks, tail = exact_groups(data, 16)
+    :param buf: Bytes-like object.
+    :param length: The length of each group.
+    :return: (list of memoryviews of length bytes, memoryview of the len(buf) % length bytes left over)
+    '''
+    data = memoryview(buf).cast('B')
+    end = len(data) - len(data) % length
+    return list(map(data.__getitem__, map(slice, range(0, end, length), range(length, end + 1, length)))), data[end:]
+
+
+def columns(buf, k):
+    '''
+    Transpose a bytes-like object into k columns: column i is every k-th byte starting at byte i, ie. the bytes
+    encrypted with byte i of a k byte repeating key. Each column is one strided slice of bytes, done in C. (Strided
+    memoryview slices are several times slower to copy out, so other buffers are copied to bytes once first.)
+    :param buf: Bytes-like object.
+    :param k: Number of columns.
+    :return: List of k bytes. The first len(buf) % k columns are one byte longer than the rest.
+    '''
+    data = bytes(buf)
+    return [data[i::k] for i in range(k)]
+
+
+def parallel_map(func, iterable, workers=None, chunksize=1):
+    '''
+    map() across a pool of worker processes. Results come back in input order, so the output doesn't depend on the
+    number of workers.
+    :param func: Module level function (or functools.partial of one) so it can be sent to the workers.
+    :param iterable: Arguments for func.
+    :param workers: Number of processes. None uses every core, 1 runs in this process without a pool.
+    :param chunksize: Number of items sent to a worker at a time.
+    :return: List of results.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        return list(map(func, iterable))
+    # concurrent.futures only imports the process pool (and multiprocessing) when it's first used
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, iterable, chunksize=chunksize))
+
+
+def bounded_map(executor, func, iterable, max_pending):
+    '''
+    Lazy executor.map() that only submits max_pending items ahead of the results being read, so a huge or endless
+    iterable isn't read into memory all at once.
+    :param executor: concurrent.futures Executor.
+    :param func: Function to call on each item.
+    :param iterable: Arguments for func.
+    :param max_pending: Maximum number of submitted items without a result read yet.
+    :return: Generator of results, in input order.
+    '''
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
 def hexbytes_to_bytestr(bytes_data):
-    l = list(map(lambda x: chr(int(x, 16)).encode(), groups(bytes_data, 2)))
-    s = b''.join(l)
-    return s
+    '''
+    Decode hex. Upper and lower case digits are accepted and whitespace anywhere is ignored. An odd trailing digit is
+    decoded as a byte on its own, so b'6' is b'\x06'.
+    :param bytes_data: Hex as bytes, bytearray, memoryview or str.
+    :return: Bytes
+    :raise ValueError: If there is anything besides hex digits and whitespace.
+    '''
+    decoder = HexDecoder()
+    return decoder.update(bytes_data) + decoder.finalize()
 
 
 def bytestr_to_hexbytes(bytestr):
-    # return b''.join([(b'%x' % b) for b in bytestr])  # Doesn't pad to two chars for hex values less than 10.
-    return b''.join(['{0:02x}'.format(b).encode() for b in bytestr])
+    '''
+    Encode bytes as lower case hex, two digits per byte.
+    '''
+    return binascii.hexlify(bytestr)
 
 
-def plaintext_score(bytestr):
+class HexDecoder:
     '''
-    Quick and dirty scoring method that uses the most common english letters.
-    :param bytestr: Bytes to check
-    :return: Int score.
+    Incremental hex decoder for chunked streams, with the same rules as hexbytes_to_bytestr(). Chunks can split a
+    byte's two digits; the odd digit is kept until the next update().
+
+        decoder = HexDecoder()
+        for chunk in iter(partial(f.read, 1 << 20), b''):
+            out.write(decoder.update(chunk))
+        out.write(decoder.finalize())
+
+    Whitespace is removed with translate() and the digits are decoded by binascii, so it runs at C speed.
+    '''
+    WHITESPACE = b' \t\n\r\v\f'
+
+    def __init__(self):
+        self.pending = b''  # odd hex digit left over from the last chunk
+
+    def update(self, chunk):
+        '''
+        :param chunk: Hex as bytes, bytearray, memoryview or str.
+        :return: Bytes decoded from every complete pair of digits so far.
+        '''
+        if isinstance(chunk, str):
+            chunk = chunk.encode('ascii')
+        digits = self.pending + bytes(chunk).translate(None, self.WHITESPACE)
+        if len(digits) % 2:
+            digits, self.pending = digits[:-1], digits[-1:]
+        else:
+            self.pending = b''
+        try:
+            return binascii.unhexlify(digits)
+        except binascii.Error as e:
+            raise ValueError('Invalid hex: ' + str(e)) from None
+
+    def finalize(self):
+        '''
+        :return: The odd trailing digit decoded as a byte, or b''.
+        '''
+        pending, self.pending = self.pending, b''
+        if not pending:
+            return b''
+        return bytes([int(pending, 16)])
+
+
+class LetterScorer:
+    '''
+    The letter frequency scorers, compiled once from the frequency tables into 256-entry lookup tables. Every score is
+    a few C-level passes over the input (bytes.translate(), bytes.count() through map()) instead of a Python loop per
+    letter, and gives the same results as the original per-letter loops.
     '''
 
+    def __init__(self, freq=letter_freq, table=letter_table, space_share=space_freq, other_share=other_freq):
+        '''
+        :param freq: Dict of upper case letter: share of the letters in English text.
+        :param table: Dict of upper case letter (or space): integer weight from 0 to 255.
+        :param space_share: Share of English text that is spaces.
+        :param other_share: Share of English text that is neither a letter nor a space.
+        '''
+
+        # weights[byte] is the letter_table weight of the byte. bytes.upper() only folds ASCII, so a lower case letter
+        # gets the weight of its upper case letter.
+        weights = bytearray(256)
+        for char, weight in table.items():
+            if not 0 <= weight <= 255:
+                raise ValueError('Weights must fit in a byte.', char, weight)
+            weights[char[0]] = weight
+            if char.isupper():
+                weights[char.lower()[0]] = weight
+        self.weights = bytes(weights)
+
+        # letter_freq in its original order, so sums are done in the same order as before
+        self.letters = tuple(char[0] for char in freq)
+        self.lower_letters = tuple(letter | 0x20 for letter in self.letters)
+        self.freqs = tuple(freq.values())
+        self.punctuation = tuple(b'\'.,;?!')
+
+        # Expected share of each chi-squared bin: the letters, then space, then everything else.
+        letter_share = 1 - space_share - other_share
+        self.expected = tuple(f * letter_share for f in self.freqs) + (space_share, other_share)
+
+    def table_score(self, bytestr):
+        '''
+        Sum of the letter_table weight of every byte. Same as plaintext_score().
+        '''
+        return sum(bytes(bytestr).translate(self.weights))
+
+    def table_score_many(self, candidates):
+        '''
+        table_score() of each candidate, with the loop over the candidates done by map() in C.
+        '''
+        return list(map(sum, map(bytes.translate, map(bytes, candidates), repeat(self.weights))))
+
+    def diff_from_norm(self, bytestr):
+        '''
+        Same as plaintext_score_diff_from_norm().
+        '''
+        upper = bytes(bytestr).upper()
+        return self.diff_from_norm_counts(map(upper.count, self.letters), map(upper.__contains__, self.punctuation),
+                                          len(upper))
+
+    def diff_from_norm_histogram(self, histogram, length):
+        '''
+        Same as plaintext_score_diff_from_norm_histogram().
+        '''
+        counts = map(add, map(histogram.__getitem__, self.letters), map(histogram.__getitem__, self.lower_letters))
+        return self.diff_from_norm_counts(counts, map(histogram.__getitem__, self.punctuation), length)
+
+    def diff_from_norm_many(self, candidates):
+        '''
+        diff_from_norm() of each candidate, with the per candidate work inlined.
+        '''
+        letters, freqs, punctuation = self.letters, self.freqs, self.punctuation
+        scores = []
+        for upper in map(bytes.upper, map(bytes, candidates)):
+            length = len(upper)
+            # Same order as diff_from_norm_counts(), so the floats match.
+            score = 0
+            for freq, count in zip(freqs, map(upper.count, letters)):
+                score += abs(freq - count / length)
+            if score == 0:
+                scores.append(0)
+            else:
+                scores.append(100 / score + sum(map(upper.__contains__, punctuation)))
+        return scores
+
+    def diff_from_norm_counts(self, counts, punctuation_counts, length):
+        # Sum of |expected - actual| letter shares, in the same order as the original loop so the floats match.
+        score = 0
+        for freq, count in zip(self.freqs, counts):
+            score += abs(freq - count / length)
+        if score == 0:
+            return 0
+        return 100 / score + sum(map(bool, punctuation_counts))
+
+    def chi_squared(self, bytestr):
+        '''
+        Chi-squared statistic of the letter, space and other byte counts against English. Lower is more English.
+        '''
+        upper = bytes(bytestr).upper()
+        return self.chi_squared_counts(list(map(upper.count, self.letters)), upper.count(b' '), len(upper))
+
+    def chi_squared_many(self, candidates):
+        '''
+        chi_squared() of each candidate.
+        '''
+        letters, chi_squared_counts = self.letters, self.chi_squared_counts
+        return [chi_squared_counts(list(map(upper.count, letters)), upper.count(b' '), len(upper))
+                for upper in map(bytes.upper, map(bytes, candidates))]
+
+    def chi_squared_histogram(self, histogram, length):
+        counts = list(map(add, map(histogram.__getitem__, self.letters),
+                          map(histogram.__getitem__, self.lower_letters)))
+        return self.chi_squared_counts(counts, histogram[ord(' ')], length)
+
+    def chi_squared_counts(self, letter_counts, spaces, length):
+        if length == 0:
+            return 0.0
+        observed = letter_counts + [spaces, length - sum(letter_counts) - spaces]
+        return sum((o - e * length) ** 2 / (e * length) for o, e in zip(observed, self.expected))
+
+
+letter_scorer = LetterScorer()
+
+
+# Bytes that make up words for WordMatcher, and a translate() table that turns every other byte into a space.
+WORD_BYTES = b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'"
+WORD_SEPARATOR_TABLE = bytes(b if b in WORD_BYTES else 0x20 for b in range(256))
+
+
+class WordMatcher:
+    '''
+    Finds every occurrence of a set of words in one pass over the bytes, instead of one search per word. Matching is
+    case insensitive and words can have weights.
+
+    With whole_words, only hits that are a whole word count: letters, digits and apostrophes are word bytes and
+    anything else separates words, so 'test.' and 'test\n' match 'test' but 'testing' doesn't. A whole word has to
+    start at a word start, so no automaton is needed: the bytes are split into words in one pass by translate() and
+    split() and each word is looked up in a dict.
 
-    # count frequency in bytestr
-    # score based on similarity to common frequency
-    score = 0
-    bytestr_upper = bytestr.upper()
+    Otherwise every occurrence counts, including overlapping ones and words inside other words, like bytes.count()
+    for each word, found by an Aho-Corasick automaton. States are ints, 0 is the root. The transitions of all states
+    are kept in one dict keyed by state << 8 | byte, which takes much less memory than a dict per state.
+    '''
+    def __init__(self, words, whole_words=True):
+        '''
+        :param words: Iterable of bytes, each worth 1, or a dict of bytes: weight.
+        :param whole_words: Only count hits on whole words.
+        '''
+        self.whole_words = whole_words
+        self.count = None
+        items = words.items() if isinstance(words, dict) else ((word, 1) for word in words)
+        self.words = {bytes(word).lower(): weight for word, weight in items if word}
+        if not whole_words:
+            self.build_automaton()
+
+    @classmethod
+    def from_mapping(cls, words):
+        '''
+        Whole word matcher over an existing mapping of lower case bytes: weight, used as it is instead of copied. With
+        a DictionaryIndex the words stay in the shared memory map.
+        :param words: Object with __contains__, __getitem__, get() and __len__, like a dict or a DictionaryIndex.
+        :return: WordMatcher
+        '''
+        matcher = cls.__new__(cls)
+        matcher.whole_words = True
+        matcher.words = words
+        # a DictionaryIndex counts a whole list of words in one call, every weight is 1
+        matcher.count = getattr(words, 'count', None)
+        return matcher
+
+    def build_automaton(self):
+        '''
+        Build the trie of the words, then fill in the fail link of each state (the state of its longest proper suffix
+        in the trie), the output link (the nearest state on the fail chain, itself included, where a word ends) and
+        the total weight of the words ending at each state.
+        '''
+        self.goto = goto = {}
+        self.depth = depth = array('I', [0])
+        # Weight of the word ending in each state, or None if no word ends there.
+        self.weights = weights = [None]
+        for word, weight in self.words.items():
+            state = 0
+            for b in word:
+                key = state << 8 | b
+                nxt = goto.get(key)
+                if nxt is None:
+                    nxt = len(depth)
+                    goto[key] = nxt
+                    depth.append(depth[state] + 1)
+                    weights.append(None)
+                state = nxt
+            weights[state] = weight
+
+        num_states = len(depth)
+        self.fail = fail = array('i', [0]) * num_states
+        self.output = output = array('i', [-1]) * num_states
+        self.totals = totals = [0] * num_states
+
+        # Parents are always done before their children when states are taken in order of depth.
+        for key, state in sorted(goto.items(), key=lambda item: depth[item[1]]):
+            parent, b = key >> 8, key & 0xff
+            if parent:
+                link = fail[parent]
+                while (link << 8 | b) not in goto and link:
+                    link = fail[link]
+                fail[state] = goto.get(link << 8 | b, 0)
+            link = fail[state]
+            if weights[state] is not None:
+                output[state] = state
+                totals[state] = weights[state] + totals[link]
+            else:
+                output[state] = output[link]
+                totals[state] = totals[link]
+
+    def hits(self, bytestr):
+        '''
+        :param bytestr: Bytes to search.
+        :return: Generator of (start, end, weight) for every hit, in order of end. bytestr[start:end] is the word.
+        '''
+        if self.whole_words:
+            words = self.words
+            start = 0
+            # translate() keeps the offsets, so each word's position is the same as in bytestr.
+            for word in bytes(bytestr).lower().translate(WORD_SEPARATOR_TABLE).split(b' '):
+                if word in words:
+                    yield start, start + len(word), words[word]
+                start += len(word) + 1
+            return
+
+        goto, fail, output, depth, weights = self.goto, self.fail, self.output, self.depth, self.weights
+        state = 0
+        for i, b in enumerate(bytestr.lower(), 1):
+            while (state << 8 | b) not in goto and state:
+                state = fail[state]
+            state = goto.get(state << 8 | b, 0)
+            hit = output[state]
+            while hit > 0:
+                yield i - depth[hit], i, weights[hit]
+                hit = output[fail[hit]]
+
+    def score(self, bytestr):
+        '''
+        :param bytestr: Bytes to search.
+        :return: Sum of the weights of every hit.
+        '''
+        if self.whole_words:
+            words = bytes(bytestr).lower().translate(WORD_SEPARATOR_TABLE).split()
+            if self.count is not None:
+                return self.count(words)
+            get = self.words.get
+            return sum(get(word, 0) for word in words)
+
+        goto, fail, totals = self.goto, self.fail, self.totals
+        score = 0
+        state = 0
+        for b in bytestr.lower():
+            while (state << 8 | b) not in goto and state:
+                state = fail[state]
+            state = goto.get(state << 8 | b, 0)
+            score += totals[state]
+        return score
+
+    def __len__(self):
+        return len(self.words)
+
+
+common_word_matcher = WordMatcher([b'FLAG', b'THE', b'AND', b'OR', b'FOR', b'YOU', b"'RE"], whole_words=False)
+
+
+def batched(score_many_func):
+    '''
+    Decorator for scoring functions that attaches score_many_func as their .score_many, the batched version of the
+    scorer. Put it below @probe, so the instrumented wrapper gets a .score_many that counts every candidate.
+    :param score_many_func: Function of a list of candidates that returns a list of their scores, the same scores as
+    calling the scoring function on each candidate.
+    '''
+    def decorate(scoring_func):
+        scoring_func.score_many = score_many_func
+        return scoring_func
+    return decorate
 
-    for i, letter in enumerate(letter_table.keys()):
-        score += bytestr_upper.count(letter) * letter_table[letter]
 
-    # if bytestr.count(b' ') < 5:
-    #     # print('NOT ENOUGH SPACES')
-    #     # return 0
-    #     pass
+def score_many(scoring_func, candidates):
+    '''
+    Score a batch of candidates in one call. Uses the scorer's .score_many if it has one (see batched()), and calls
+    it on each candidate otherwise, so any function of bytes can be used.
+    :param scoring_func: Function that scores a plaintext bytestring, higher is better.
+    :param candidates: Sequence of bytes-like candidates, like the rows of an N x L matrix.
+    :return: List of scores, in the order of candidates.
+    '''
+    batch = getattr(scoring_func, 'score_many', None)
+    if batch is not None:
+        return batch(candidates)
+    return list(map(scoring_func, candidates))
 
-    return score
 
+def plaintext_score_many(candidates):
+    return letter_scorer.table_score_many(candidates)
 
-def plaintext_score_complex(bytestr):
 
-    # print(bytestr)
-    # print('len', len(bytestr))
+@probe
+@batched(plaintext_score_many)
+def plaintext_score(bytestr):
+    '''
+    Quick and dirty scoring method that uses the most common english letters.
+    :param bytestr: Bytes to check
+    :return: Int score.
+    '''
+    # sum of letter_table weights of every byte, case insensitive
+    return letter_scorer.table_score(bytestr)
 
-    score = 0
 
+def plaintext_score_complex_many(candidates):
+    '''
+    plaintext_score_complex() of each candidate. This is the implementation, plaintext_score_complex() scores a batch
+    of one.
+    '''
     # weights
     COMMON_WEIGHT = 10  # 3
     PUNCTUATION_WEIGHT = 0  # 1
@@ -132,95 +574,94 @@ def plaintext_score_complex(bytestr):
     CONSECUTIVE_SPACES_PENALTY = -1000
     COMMON_WORD_BONUS = 0
 
-    common_words = [b'FLAG', b'THE', b'AND', b'OR', b'FOR', b'YOU', b"'RE"]
+    candidates = list(map(bytes, candidates))
+    scores = letter_scorer.table_score_many(candidates)
 
-    bytestr_upper = bytestr.upper()
+    for i, bytestr in enumerate(candidates):
+        score = scores[i]
 
-    for i, letter in enumerate(letter_table.keys()):
-        score += bytestr_upper.count(letter) * letter_table[letter]
+        # number of weird characters is the number of bytes deleted by translate()
+        score += (len(bytestr) - len(bytestr.translate(None, br'\/#$%|<>=&'))) * WEIRD_CHAR_PENALTY
 
-    # print(bytestr)
-    for byte in bytestr:
-        # if bytes([byte]) in b',.?;:\'"/:!':
-        #     score += PUNCTUATION_WEIGHT
+        try:
+            if bytestr.decode().isprintable():
+                score += ISPRINTABLE_WEIGHT
 
-        if bytes([byte]) in br'\/#$%|<>=&':
-            score += WEIRD_CHAR_PENALTY
+            if b' ' not in bytestr:
+                score += NO_SPACES_PENALTY
 
-    try:
-        if bytestr.decode().isprintable():
-            score += ISPRINTABLE_WEIGHT
+            if b'  ' in bytestr:
+                score += CONSECUTIVE_SPACES_PENALTY
+
+            # every occurrence of the common words, found in one pass
+            if COMMON_WORD_BONUS:
+                score += common_word_matcher.score(bytestr) * COMMON_WORD_BONUS
+
+        except UnicodeDecodeError:
+            score -= UNICODEDECODEERROR_WEIGHT
+
+        scores[i] = score
 
-        if b' ' not in bytestr:
-            score += NO_SPACES_PENALTY
+    return scores
 
-        if b'  ' in bytestr:
-            score += CONSECUTIVE_SPACES_PENALTY
 
-        for word in common_words:
-            if word.upper() in bytestr.upper():
-                score += COMMON_WORD_BONUS
-                # print("COMMON_WORD_BONUS", word)
+@probe
+@batched(plaintext_score_complex_many)
+def plaintext_score_complex(bytestr):
+    return plaintext_score_complex_many((bytestr,))[0]
 
-    except UnicodeDecodeError:
-        score -= UNICODEDECODEERROR_WEIGHT
 
-    # print('score', score)
-    return score
+def plaintext_score_dict_many(candidates):
+    score = load_dict_matcher().score
+    return list(map(score, candidates))
 
 
+@probe
+@batched(plaintext_score_dict_many)
 def plaintext_score_dict(bytestr):
     '''
     Score based on appreance of words from an English Dictionary.
     Dictionary here:
     https://github.com/berzerk0/Probable-Wordlists/tree/master/Dictionary-Style#mainenglishdictionary_probwltxt
 
-    Must call load_dict() before calling this function.
+    Every whole dictionary word counts, wherever it is, so words next to punctuation or newlines are found too. The
+    words are matched in one pass by a WordMatcher, built from the dictionary index on first use.
 
     :param bytestr:
     :return:
     '''
-    if DEBUG: print(bytestr)
-    if DEBUG: print('len', len(bytestr))
-
-    # List loaded from file of dictionary words
-    global word_set
-
-    # Load the dictionary into memory if it hasn't already been done.
-    if not word_set:
-        load_dict(DICTIONARY_FILE)
+    return load_dict_matcher().score(bytestr)
 
-    score = 0
 
-    # weights
-    WORD_BONUS = 1
-    UNICODEDECODEERROR_WEIGHT = 0
-
-
-    try:
-        for word in bytestr.split(b' '):
-            if DEBUG: print(word)
-            if word.lower().decode() in word_set:
-                score += WORD_BONUS
-                if DEBUG: print("WORD_BONUS", word)
-
-    except UnicodeDecodeError:
-        score -= UNICODEDECODEERROR_WEIGHT
-
-    # print('score', score)
-    return score
+def plaintext_score_historgram_many(candidates):
+    return [100 / (1 + chi2) for chi2 in letter_scorer.chi_squared_many(candidates)]
 
 
+@probe
+@batched(plaintext_score_historgram_many)
 def plaintext_score_historgram(bytestr):
     '''
     Stack percentages of each character. Closest to normal histogram wins.
+    Compares the counts of each letter, spaces and other bytes with English using a chi-squared test.
     :param bytestr:
-    :return:
+    :return: Float score from 0 to 100, higher is more English.
+    '''
+    return 100 / (1 + letter_scorer.chi_squared(bytestr))
+
+
+def plaintext_score_historgram_histogram(histogram, length):
     '''
-    # TODO
-    return 0
+    Same score as plaintext_score_historgram(), computed from a byte histogram. See byte_histogram().
+    '''
+    return 100 / (1 + letter_scorer.chi_squared_histogram(histogram, length))
+
 
+def plaintext_score_diff_from_norm_many(candidates):
+    return letter_scorer.diff_from_norm_many(candidates)
 
+
+@probe
+@batched(plaintext_score_diff_from_norm_many)
 def plaintext_score_diff_from_norm(bytestr):
     '''
     Count the percentage points from normal for each alphabet character.
@@ -228,39 +669,57 @@ def plaintext_score_diff_from_norm(bytestr):
     :param bytes:
     :return:
     '''
+    return letter_scorer.diff_from_norm(bytestr)
+
 
-    this_letter_freq = letter_freq
+def byte_histogram(bytestr):
+    '''
+    Count how many times each byte value appears.
+    :param bytestr: Bytes
+    :return: List of 256 counts, indexed by byte value.
+    '''
+    histogram = [0] * 256
+    for byte, count in Counter(bytestr).items():
+        histogram[byte] = count
+    return histogram
 
-    score = 0
 
-    for char in letter_freq.keys():
-        # print(char, type(char))
-        # print(bytestr.upper().count(char))
-        # print(bytestr.upper().count(char) / len(bytestr))
-        # this_letter_freq[char] = bytestr.upper().count(char) / len(bytestr)
+def plaintext_score_diff_from_norm_histogram(histogram, length):
+    '''
+    Same score as plaintext_score_diff_from_norm(), computed from a byte histogram instead of the bytes themselves.
+    :param histogram: Sequence of 256 counts, indexed by byte value. See byte_histogram().
+    :param length: Number of bytes the histogram was built from.
+    :return: Float score, identical to plaintext_score_diff_from_norm() on the same bytes.
+    '''
+    return letter_scorer.diff_from_norm_histogram(histogram, length)
 
-        score += abs(letter_freq[char] - (bytestr.upper().count(char) / len(bytestr)))
 
-    # pprint(this_letter_freq)
-    # sorted_freq = OrderedDict(sorted(this_letter_freq.items(), key=lambda x: x[1], reverse=True))
-    # pprint(sorted_freq)
+def plaintext_score_ngram_many(candidates):
+    return load_ngram_scorer().score_many(candidates)
 
-    punctuation_boost = 0
-    punctuation_set = b'\'.,;?!'
-    for punc in punctuation_set:
-        if bytestr.count(punc) > 0:
-            punctuation_boost += 1
 
-    # try:
-    #     if not bytestr.decode().isprintable():
-    #         return 0
-    # except UnicodeDecodeError:
-    #     return 0
+@probe
+@batched(plaintext_score_ngram_many)
+def plaintext_score_ngram(bytestr):
+    '''
+    Log-likelihood of the bytes under a trigram model of English, see NgramScorer. Unlike the letter frequency scorers
+    it knows that 'the' is more English than 'hte', which matters most for short plaintexts.
+    :param bytestr: Bytes to check
+    :return: Float score, 0 or less, higher is more English.
+    '''
+    return load_ngram_scorer().score(bytestr)
 
-    if score == 0:
-        return 0
 
-    return 100 / score + punctuation_boost
+def plaintext_score_unigram_histogram(histogram, length):
+    '''
+    Log-likelihood of the bytes counted in a histogram under the byte frequencies of English, see
+    NgramScorer.histogram_score(). Used to solve the columns of repeating-key xor, where neighbouring bytes of a column
+    aren't neighbours in the plaintext, so only byte frequencies are left to go on.
+    :param histogram: Sequence of 256 counts, indexed by byte value. See byte_histogram().
+    :param length: Number of bytes the histogram was built from.
+    :return: Float log-likelihood, 0 or less, higher is more English.
+    '''
+    return load_ngram_scorer().histogram_score(histogram, length)
 
 
 def load_dict(file):
@@ -271,85 +730,498 @@ def load_dict(file):
         for line in f.readlines():
             word_set.add(line.strip())
 
-        # if DEBUG: print(dictionary)
-        if DEBUG: print(type(word_set))
-        if DEBUG: print(len(word_set))
-        # if DEBUG: print(dictionary[100])
+        logger.debug('Loaded %d words from %s', len(word_set), file)
         return
 
     raise IOError("Failed to load dictionary from file: " + file)
 
 
-class ScoredPlaintext(namedtuple('ScoredPlaintext', 'bytestr')):
-    def __new__(cls, bytestr, scoring_func=plaintext_score_diff_from_norm, key=None):
-        self = super(ScoredPlaintext, cls).__new__(cls, bytestr)
-        self._score = scoring_func(bytestr)
-        self._key = key
-        return self
+class DictionaryIndex:
+    '''
+    Read-only word set in a memory-mapped file, queried with bytes without decoding. The file is an open addressing
+    hash table:
+        header   4s magic, uint32 version, uint32 number of slots (a power of two), uint32 number of words
+        slots    uint32 crc32 and uint32 file offset of the word in each slot, offset 0 for an empty slot
+        words    uint16 length followed by the word bytes, for each word
+    Slots are found by zlib.crc32() of the word, which unlike hash() is the same in every process. The crc32 is kept in
+    the slot too, so the stored word is only read when it is almost certainly the one looked up.
+    It also reads as a mapping of word: 1, so WordMatcher.from_mapping() can use it without copying the words.
+    '''
+    MAGIC = b'CPDX'
+    VERSION = 2
+    HEADER = struct.Struct('<4sIII')
+    SLOT = struct.Struct('<II')
+    LENGTH = struct.Struct('<H')
+    # Words count() remembers the answer for in each process, before it starts over.
+    CACHE_WORDS = 1 << 15
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_slots, self.num_words = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.map.close()
+            raise ValueError('Not a dictionary index: ' + str(path))
+        self.mask = self.num_slots - 1
+        # count()'s answers so far, word: 1 if it is in the index, 0 if not
+        self.cache = {}
+
+        # Index the slots as ints without copying them where the file's byte order is native. Slot i is the crc32 at
+        # slots[2 * i] and the offset at slots[2 * i + 1].
+        slots = memoryview(self.map)[self.HEADER.size:self.HEADER.size + self.num_slots * self.SLOT.size]
+        if sys.byteorder == 'little':
+            self.slots = slots.cast('I')
+        else:
+            self.slots = array('I', slots)
+            self.slots.byteswap()
+            slots.release()
+
+    def __contains__(self, word):
+        slots, data, mask = self.slots, self.map, self.mask
+        length = len(word)
+        if length > 0xffff:
+            # longer than any stored word, whose lengths are uint16
+            return False
+        crc = zlib.crc32(word)
+        slot = crc & mask
+        offset = slots[2 * slot + 1]
+        while offset:
+            # Compare the stored length and the word in one slice, only when the crc32 matches.
+            if slots[2 * slot] == crc and data[offset:offset + 2 + length] == length.to_bytes(2, 'little') + word:
+                return True
+            slot = (slot + 1) & mask
+            offset = slots[2 * slot + 1]
+        return False
+
+    def count(self, words):
+        '''
+        Number of words in the index, repeats included. Answers are remembered, so words seen before are counted by a
+        dict lookup in C instead of a probe of the map. The remembered words are dropped when there would be more than
+        CACHE_WORDS of them.
+        :param words: List of lower case bytes.
+        :return: Int
+        '''
+        cache = self.cache
+        try:
+            return sum(map(cache.__getitem__, words))
+        except KeyError:
+            pass
+
+        new = set(filterfalse(cache.__contains__, words))
+        if len(cache) + len(new) > self.CACHE_WORDS:
+            cache.clear()
+            new = set(words)
+        new = list(new)
+        cache.update(zip(new, repeat(0)))
+
+        # __contains__() done for all the new words at once. The crc32s and first slots are read by map() in C, and a
+        # word whose first slot is empty isn't in the index, so only the rest are probed in Python.
+        slots, data = self.slots, self.map
+        positions_mask = self.mask << 1  # slot i's crc32 is at slots[2 * i], its offset at slots[2 * i + 1]
+        crcs = list(map(zlib.crc32, new))
+        positions = list(map(and_, map(lshift, crcs, repeat(1)), repeat(positions_mask)))
+        occupied = map(slots.__getitem__, map(add, positions, repeat(1)))
+        for word, crc, position in compress(zip(new, crcs, positions), occupied):
+            offset = slots[position + 1]
+            while offset:
+                if slots[position] == crc and len(word) <= 0xffff and \
+                        data[offset:offset + 2 + len(word)] == len(word).to_bytes(2, 'little') + word:
+                    cache[word] = 1
+                    break
+                position = (position + 2) & positions_mask
+                offset = slots[position + 1]
+        return sum(map(cache.__getitem__, words))
+
+    def __getitem__(self, word):
+        if word in self:
+            return 1
+        raise KeyError(word)
+
+    def get(self, word, default=None):
+        return 1 if word in self else default
+
+    def __len__(self):
+        return self.num_words
+
+    def __iter__(self):
+        # The words are stored one after another following the slots.
+        offset = self.HEADER.size + self.num_slots * self.SLOT.size
+        for _ in range(self.num_words):
+            length = self.LENGTH.unpack_from(self.map, offset)[0]
+            offset += self.LENGTH.size
+            yield self.map[offset:offset + length]
+            offset += length
+
+    def close(self):
+        if isinstance(self.slots, memoryview):
+            self.slots.release()
+        self.map.close()
+
+    @classmethod
+    def build(cls, words, path):
+        '''
+        Write an index of words to path. The file is written next to path and renamed into place, so processes
+        building the same index at the same time don't see a partial file.
+        :param words: Iterable of bytes. Duplicates and empty words are dropped.
+        :param path: File to write.
+        '''
+        words = sorted(set(word for word in words if word))
+        num_slots = 1
+        while num_slots < 2 * len(words):
+            num_slots *= 2
+
+        slots = [0] * (2 * num_slots)
+        entries = bytearray()
+        offset = cls.HEADER.size + num_slots * cls.SLOT.size
+        for word in words:
+            crc = zlib.crc32(word)
+            slot = crc & (num_slots - 1)
+            while slots[2 * slot + 1]:
+                slot = (slot + 1) & (num_slots - 1)
+            slots[2 * slot] = crc
+            slots[2 * slot + 1] = offset + len(entries)
+            entries += cls.LENGTH.pack(len(word)) + word
+
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, num_slots, len(words)))
+            f.write(struct.pack('<%dI' % len(slots), *slots))
+            f.write(entries)
+        os.replace(temp_path, path)
+
+
+def build_dict_index(file, index_file=None):
+    '''
+    Build the binary index of a word list, one word per line. Words are stripped and lower cased.
+    :param file: Word list.
+    :param index_file: Index to write. Defaults to file + DICTIONARY_INDEX_SUFFIX.
+    :return: Path of the index.
+    '''
+    if index_file is None:
+        index_file = file + DICTIONARY_INDEX_SUFFIX
+    with open(file, 'rb') as f:
+        DictionaryIndex.build((line.strip().lower() for line in f), index_file)
+    logger.debug('Built dictionary index %s', index_file)
+    return index_file
 
-    @property
-    def score(self):
-        return self._score
 
-    def key(self):
-        return self._key
+def load_dict_matcher():
+    '''
+    The WordMatcher of DICTIONARY_FILE used by plaintext_score_dict(), made the first time it is needed in this
+    process. It looks words up in the memory mapped dictionary index, so the words aren't copied into each process.
+    :return: WordMatcher
+    '''
+    global dict_index, dict_matcher
 
-    def __str__(self):
-        if self._key:
-            return "ScoredPlaintext: Key: " + str(self._key) + "\tScore: " + str(self.score) + "\tBytestring: " + str(
-                self.bytestr)
-        return "ScoredPlaintext: Score: " + str(self.score) + "\tBytestring: " + str(self.bytestr)
+    # Build the dictionary matcher if it hasn't already been done.
+    if dict_matcher is None:
+        if dict_index is None:
+            dict_index = load_dict_index(DICTIONARY_FILE)
+        dict_matcher = WordMatcher.from_mapping(dict_index)
+    return dict_matcher
+
+
+def load_dict_index(file=DICTIONARY_FILE):
+    '''
+    Open the index of a word list, building it first if it is missing or older than the word list. An index that
+    can't be read, like one written by an older version, is built again.
+    :param file: Word list. Only needed if the index has to be built.
+    :return: DictionaryIndex
+    '''
+    index_file = file + DICTIONARY_INDEX_SUFFIX
+    if not os.path.exists(index_file) or \
+            (os.path.exists(file) and os.path.getmtime(index_file) < os.path.getmtime(file)):
+        build_dict_index(file, index_file)
+    try:
+        return DictionaryIndex(index_file)
+    except (ValueError, struct.error):
+        if not os.path.exists(file):
+            raise
+        logger.debug('Rebuilding unreadable dictionary index %s', index_file)
+    build_dict_index(file, index_file)
+    return DictionaryIndex(index_file)
+
+
+# Byte classes of NgramScorer. The letters are 1 to 26, case folded.
+NGRAM_NUM_CLASSES = 32
+NGRAM_OTHER, NGRAM_SPACE, NGRAM_PUNCTUATION, NGRAM_QUOTE, NGRAM_DIGIT, NGRAM_SYMBOL = 0, 27, 28, 29, 30, 31
+NGRAM_CLASS_TABLE = bytes((b | 0x20) - 0x60 if chr(b).isascii() and chr(b).isalpha() else
+                          NGRAM_SPACE if b in b' \t\r\n' else
+                          NGRAM_PUNCTUATION if b in b'.,;:!?' else
+                          NGRAM_QUOTE if b in b'\'"-' else
+                          NGRAM_DIGIT if b in b'0123456789' else
+                          NGRAM_SYMBOL if 0x21 <= b <= 0x7e else
+                          NGRAM_OTHER
+                          for b in range(256))
+
+
+class NgramScorer:
+    '''
+    Bigram/trigram language model scorer. Bytes are mapped to NUM_CLASSES classes with translate() (the 26 letters
+    case folded, whitespace, punctuation, quotes, digits, other printable, everything else), and a plaintext scores
+        sum of log P(class | previous classes) + sum of log P(byte | its class)
+    The second sum keeps what the classes throw away, like upper vs lower case and which unprintable byte it was.
+    histogram_score() scores the bytes without their order, from log P(class) + log P(byte | its class) of each byte.
+
+    The tables are flat arrays of log-probabilities indexed by class pairs (prev * NUM_CLASSES + class) and triples,
+    trained once from a corpus with interpolated smoothing, and saved to a binary cache file. Scoring is a few map()
+    passes in C over the class bytes.
+    '''
+    MAGIC = b'CPNG'
+    VERSION = 2
+    HEADER = struct.Struct('<4sIII')
+    NUM_CLASSES = NGRAM_NUM_CLASSES
+    SPACE = NGRAM_SPACE
+    CLASS_TABLE = NGRAM_CLASS_TABLE
+
+    # Interpolation weights of the trigram, bigram and unigram estimates.
+    TRIGRAM_WEIGHTS = (0.6, 0.3, 0.1)
+    BIGRAM_WEIGHTS = (0.75, 0.25)
+
+    def __init__(self, byte_logp, class_logp, bigram_logp, trigram_logp, order=3):
+        '''
+        :param byte_logp: 256 log P(byte | class of byte).
+        :param class_logp: NUM_CLASSES log P(class).
+        :param bigram_logp: NUM_CLASSES ** 2 log P(class | previous class), indexed by prev * NUM_CLASSES + class.
+        :param trigram_logp: NUM_CLASSES ** 3 log P(class | two previous classes).
+        :param order: 2 to score with bigrams, 3 with trigrams.
+        '''
+        if order not in (2, 3):
+            raise ValueError('order must be 2 or 3', order)
+        k = self.NUM_CLASSES
+        self.order = order
+        self.byte_logp = array('d', byte_logp)
+        self.class_logp = array('d', class_logp)
+        self.bigram_logp = array('d', bigram_logp)
+        self.trigram_logp = array('d', trigram_logp)
+        if len(self.byte_logp) != 256 or len(self.class_logp) != k or len(self.bigram_logp) != k ** 2 or \
+                len(self.trigram_logp) != k ** 3:
+            raise ValueError('Wrong table sizes.')
+
+        # Nested lists of the same tables, so a lookup is table[a][b][c] done by map() with no index arithmetic.
+        self.byte_list = self.byte_logp.tolist()
+        # log P(byte) of each byte on its own, for histogram_score()
+        self.unigram_list = [self.byte_list[b] + self.class_logp[self.CLASS_TABLE[b]] for b in range(256)]
+        bigrams = self.bigram_logp.tolist()
+        self.bigram_rows = [bigrams[i:i + k] for i in range(0, k ** 2, k)]
+        trigrams = self.trigram_logp.tolist()
+        self.trigram_rows = [[trigrams[j:j + k] for j in range(i, i + k ** 2, k)] for i in range(0, k ** 3, k ** 2)]
+
+        # Plaintexts are scored as if they came after spaces.
+        self.padding = bytes([self.SPACE]) * (order - 1)
+
+    @classmethod
+    def train(cls, corpus, order=3):
+        '''
+        :param corpus: English text as bytes.
+        :param order: See __init__().
+        :return: NgramScorer
+        '''
+        k = cls.NUM_CLASSES
+        classes = bytes([cls.SPACE, cls.SPACE]) + bytes(corpus).translate(cls.CLASS_TABLE)
+        unigrams = Counter(classes[2:])
+        bigrams = Counter(zip(classes[1:], classes[2:]))
+        trigrams = Counter(zip(classes, classes[1:], classes[2:]))
+        bigram_contexts = Counter(classes[1:-1])
+        trigram_contexts = Counter(zip(classes, classes[1:-1]))
+
+        # add one smoothing, so every class has some probability
+        total = len(classes) - 2
+        p1 = [(unigrams[c] + 1) / (total + k) for c in range(k)]
+
+        def p2(b, c):
+            return bigrams[b, c] / bigram_contexts[b] if bigram_contexts[b] else p1[c]
+
+        l2, l1 = cls.BIGRAM_WEIGHTS
+        bigram_logp = [math.log(l2 * p2(b, c) + l1 * p1[c]) for b in range(k) for c in range(k)]
+
+        l3, l2, l1 = cls.TRIGRAM_WEIGHTS
+        trigram_logp = []
+        for a in range(k):
+            for b in range(k):
+                context = trigram_contexts[a, b]
+                for c in range(k):
+                    p3 = trigrams[a, b, c] / context if context else p2(b, c)
+                    trigram_logp.append(math.log(l3 * p3 + l2 * p2(b, c) + l1 * p1[c]))
+
+        # P(byte | class), with half a count for each byte so unseen bytes of a class aren't impossible
+        byte_counts = Counter(bytes(corpus))
+        class_totals = [0.0] * k
+        for b in range(256):
+            class_totals[cls.CLASS_TABLE[b]] += byte_counts[b] + 0.5
+        byte_logp = [math.log((byte_counts[b] + 0.5) / class_totals[cls.CLASS_TABLE[b]]) for b in range(256)]
+
+        return cls(byte_logp, [math.log(p) for p in p1], bigram_logp, trigram_logp, order)
+
+    def score(self, bytestr):
+        '''
+        :param bytestr: Bytes to check
+        :return: Float log-likelihood, 0 or less, higher is more English.
+        '''
+        bytestr = bytes(bytestr)
+        classes = self.padding + bytestr.translate(self.CLASS_TABLE)
+        if self.order == 3:
+            rows = map(getitem, map(self.trigram_rows.__getitem__, classes), classes[1:])
+            score = sum(map(getitem, rows, classes[2:]))
+        else:
+            score = sum(map(getitem, map(self.bigram_rows.__getitem__, classes), classes[1:]))
+        return score + sum(map(self.byte_list.__getitem__, bytestr))
+
+    def score_many(self, candidates):
+        return list(map(self.score, candidates))
+
+    def histogram_score(self, histogram, length=None):
+        '''
+        Log-likelihood of the bytes counted in a histogram, each byte scored on its own. It can't use letter order like
+        score(), but it costs the same for any number of bytes and, unlike the letter frequency scorers, tells upper
+        from lower case.
+        :param histogram: Sequence of 256 counts, indexed by byte value. See byte_histogram().
+        :param length: Unused, for the (histogram, length) signature of the histogram scorers.
+        :return: Float log-likelihood, 0 or less, higher is more English.
+        '''
+        return sum(map(mul, histogram, self.unigram_list))
+
+    def save(self, path):
+        '''
+        Write the tables to path, through a temporary file like DictionaryIndex.build().
+        '''
+        tables = self.byte_logp + self.class_logp + self.bigram_logp + self.trigram_logp
+        if sys.byteorder != 'little':
+            tables.byteswap()
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.NUM_CLASSES, self.order))
+            tables.tofile(f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        :param path: File written by save().
+        :return: NgramScorer
+        '''
+        k = cls.NUM_CLASSES
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, num_classes, order = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION or num_classes != k:
+            raise ValueError('Not an n-gram table file: ' + str(path))
+        tables = array('d')
+        tables.frombytes(data[cls.HEADER.size:])
+        if sys.byteorder != 'little':
+            tables.byteswap()
+        bigrams = 256 + k
+        trigrams = bigrams + k ** 2
+        return cls(tables[:256], tables[256:bigrams], tables[bigrams:trigrams], tables[trigrams:], order)
+
+
+def build_ngram_tables(file, cache_file=None, order=3):
+    '''
+    Train an NgramScorer on a corpus and save its tables.
+    :param file: English text.
+    :param cache_file: Tables to write. Defaults to file + NGRAM_CACHE_SUFFIX.
+    :return: NgramScorer
+    '''
+    if cache_file is None:
+        cache_file = file + NGRAM_CACHE_SUFFIX
+    with open(file, 'rb') as f:
+        scorer = NgramScorer.train(f.read(), order)
+    scorer.save(cache_file)
+    logger.debug('Built n-gram tables %s', cache_file)
+    return scorer
+
+
+def load_ngram_scorer(file=None):
+    '''
+    The NgramScorer used by plaintext_score_ngram(), loaded from the cached tables of the corpus the first time it is
+    needed in this process. The tables are trained again if the cache is missing, unreadable or older than the corpus.
+    :param file: Corpus. Defaults to NGRAM_CORPUS_FILE. Giving a file always loads its tables.
+    :return: NgramScorer
+    '''
+    global ngram_scorer
+
+    if file is None:
+        if ngram_scorer is None:
+            ngram_scorer = load_ngram_scorer(NGRAM_CORPUS_FILE)
+        return ngram_scorer
+
+    cache_file = file + NGRAM_CACHE_SUFFIX
+    if os.path.exists(cache_file) and \
+            not (os.path.exists(file) and os.path.getmtime(cache_file) < os.path.getmtime(file)):
+        try:
+            return NgramScorer.load(cache_file)
+        except (ValueError, struct.error):
+            logger.debug('Rebuilding unreadable n-gram tables %s', cache_file)
+    return build_ngram_tables(file, cache_file)
 
 
-########
-#  TESTS
-def test_groups():
-    data = 'abcde'
-    for pair in groups(data, 2):
-        print(pair)
+class ScoreOrdered:
+    '''
+    Mixin that orders candidates by their .score, so sorted(), max() and heapq work on them directly. Equality is
+    still identity, two different plaintexts with the same score aren't equal.
+    '''
+    __slots__ = ()
 
-    pair_list = [pairs for pairs in groups(data, 2)]
-    assert pair_list == ['ab', 'cd', 'e']
+    def __lt__(self, other):
+        return self.score < other.score
 
-    data = b'abcde'
-    for pair in groups(data, 2):
-        print(pair)
+    def __le__(self, other):
+        return self.score <= other.score
 
-    pair_list = [pairs for pairs in groups(data, 2)]
-    assert pair_list == [b'ab', b'cd', b'e']
+    def __gt__(self, other):
+        return self.score > other.score
 
+    def __ge__(self, other):
+        return self.score >= other.score
 
-def test_ScoredPlaintext():
-    sp = ScoredPlaintext(b'abcdef')
-    print(sp)
-    print(sp.score)
 
-    sp2 = ScoredPlaintext(b'\x1b77316?x\x15\x1b\x7f+x413=x9x(7-6<x7>x:9;76', scoring_func=plaintext_score)
-    print(sp2)
-    print(sp2.score)
-    print(plaintext_score_dict("This is a test sentence!".encode()))
-    print(plaintext_score_dict(
-        b'\x0b\n\x0bZ\x0fZ\t_\x0bY\x0b\x02\t\r\x0b\x03\t_\t]\n\x0e\t\x0e\x0e\r\t_\n_\x0b\x0c\x0bZ\x0cZ\x0b\x03\n\x0e\t]\x0eY\x0f\x0f\x08\x03Z\x0f\n\x0e\x0bY\n\x08\t^\t\x0b1'))
+class ScoredPlaintext(ScoreOrdered):
+    '''
+    A plaintext and its score. With __slots__ there is no per instance __dict__, see test_ScoredPlaintext_memory().
+    '''
+    __slots__ = ('bytestr', 'score', '_key')
+
+    def __init__(self, bytestr, scoring_func=None, key=None):
+        # Default looked up at call time so instrumentation sees it.
+        if scoring_func is None:
+            scoring_func = plaintext_score_diff_from_norm
+        self.bytestr = bytestr
+        self.score = scoring_func(bytestr)
+        self._key = key
 
+    def key(self):
+        return self._key
 
-def test_ScoredPlaintext_diff_from_norm():
-    print(ScoredPlaintext(b'test test test', scoring_func=plaintext_score_diff_from_norm))
-    print(ScoredPlaintext(b'This is only a test.', scoring_func=plaintext_score_diff_from_norm))
-    print(ScoredPlaintext(
-        b'In addition to the usual mapping methods, ordered dictionaries also support reverse iteration using reversed().',
-        scoring_func=plaintext_score_diff_from_norm))
+    def __repr__(self):
+        return 'ScoredPlaintext(bytestr=%r, score=%r, key=%r)' % (self.bytestr, self.score, self._key)
 
+    def __str__(self):
+        if self._key:
+            return "ScoredPlaintext: Key: " + str(self._key) + "\tScore: " + str(self.score) + "\tBytestring: " + str(
+                self.bytestr)
+        return "ScoredPlaintext: Score: " + str(self.score) + "\tBytestring: " + str(self.bytestr)
 
-def test_load_dict():
-    load_dict(DICTIONARY_FILE)
-    # print(word_set)
-    assert plaintext_score_dict(b'this is only a test') == 5
-    assert 'test' in word_set
 
+def top_k_scored(scored, top_k=None):
+    '''
+    Order scored plaintexts best first. With top_k, only the best top_k are kept using a bounded heap instead of
+    sorting everything. Ties keep their input order either way.
+    :param scored: Iterable of objects with a .score, like ScoredPlaintext. Consumed lazily.
+    :param top_k: Number of results to keep. None keeps all of them.
+    :return: List, best score first.
+    '''
+    if top_k is None:
+        return sorted(scored, key=attrgetter('score'), reverse=True)
+    return heapq.nlargest(top_k, scored, key=attrgetter('score'))
 
-def test_bytestr_to_hexbytes():
-    print(bytestr_to_hexbytes(b'AAAA'))
-    assert bytestr_to_hexbytes(b'AAAA') == b'41414141'
 
-    print(bytestr_to_hexbytes(b'\x01'))
-    assert bytestr_to_hexbytes(b'\x01') == b'01'
+def merge_top_k(scored_iterables, top_k=None):
+    '''
+    Streaming top-k across many inputs, ie. the per-line results of a corpus scan. Only top_k candidates are held at
+    a time, so each input can be a generator.
+        best = merge_top_k((decode_all_single_byte_xor(line, top_k=10) for line in lines), top_k=10)
+    :param scored_iterables: Iterable of iterables of scored objects.
+    :param top_k: Number of results to keep. None keeps all of them.
+    :return: List, best score first.
+    '''
+    return top_k_scored(chain.from_iterable(scored_iterables), top_k)
@@ -1,107 +1,369 @@
 # standard library imports
-import base64  # Only for testing against base_64
+import concurrent.futures
+import heapq
+import mmap
+import os
 import statistics
-from collections import namedtuple
-from itertools import zip_longest, combinations
-
-# library imports
-import pytest
+from collections import deque, namedtuple
+from contextlib import ExitStack
+from functools import partial
+from itertools import chain, combinations, islice
+from operator import attrgetter, itemgetter
 
 # local code imports
 import util
+from instrument import probe
+from memo import memoized
+
+# Number of bytes XORed per integer operation. Bounds the size of the temporary ints for large buffers.
+XOR_CHUNK_SIZE = 1 << 20
+
+# Key length estimation. Blocks are compared with the blocks up to KEY_LENGTH_MAX_SHIFTS positions after them, and
+# at most KEY_LENGTH_MAX_BYTES of the ciphertext (spread over KEY_LENGTH_SAMPLE_WINDOWS windows) is used per key size.
+KEY_LENGTH_MAX_SHIFTS = 4
+KEY_LENGTH_MAX_BYTES = 1 << 20
+KEY_LENGTH_SAMPLE_WINDOWS = 16
+# A key length that is a multiple of another candidate scoring within this fraction of it is ranked after it.
+KEY_LENGTH_MULTIPLE_TOLERANCE = 0.05
+# Ciphertexts shorter than this are scored in this process, even when more workers are allowed.
+PARALLEL_MIN_BYTES = 1 << 18
+
+# decode_all_single_byte_xor() scores the 256 candidate plaintexts in batches of about this many bytes, so a long
+# ciphertext doesn't have all 256 plaintexts in memory at once.
+SCORE_BATCH_BYTES = 1 << 20
+
+# Bytes processed per chunk by repeating_key_xor_stream().
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Lines of hex sent to a worker at a time by scan_single_byte_xor().
+SCAN_BATCH_LINES = 4096
+
+ScanResult = namedtuple('ScanResult', 'line_number key score plaintext')
 
-# Set True to print debug messages.
-DEBUG = False
+KeyLengthCandidate = namedtuple('KeyLengthCandidate', 'key_len score confidence')
 
-def fixed_xor(one, two):
+RepeatingKeyXorResult = namedtuple('RepeatingKeyXorResult', 'key plaintext score column_scores')
+
+# XOR_TABLES[k] is a bytes.translate() table that XORs every byte with k. Each table is built with one integer XOR
+# of the identity table, which keeps the import fast.
+XOR_TABLES = [(int.from_bytes(bytes(range(256)), 'big') ^ int.from_bytes(bytes((k,)) * 256, 'big')).to_bytes(256, 'big')
+              for k in range(256)]
+
+# XOR_HISTOGRAM_PERMUTATIONS[k](histogram) is the histogram of the bytes after XOR with k.
+XOR_HISTOGRAM_PERMUTATIONS = [itemgetter(*table) for table in XOR_TABLES]
+
+
+@probe
+def fixed_xor(one, two, out=None):
     '''
     Returns XOR combination of two equal length bytestrings.
+    Works on bytes, bytearray and memoryview. The XOR is done on whole chunks as integers instead of byte by byte, so
+    the cost is linear in the length of the input.
     :param one: Bytes
     :param two: Bytes
-    :return: Bytes
+    :param out: Optional writable buffer (bytearray, memoryview) of at least len(one) bytes. The result is written
+    into it instead of allocating new bytes. It may be the same buffer as one or two for an in-place XOR.
+    :return: Bytes, or out if it was given.
     '''
 
-    result = b''
-
-    # print(len(one))
     # test equal len
     if len(one) != len(two):
         raise ValueError('Parameter lengths are not equal.', len(one), len(two), one, two)
-    # xor byte by byte
 
-    for i in range(len(one)):
-        # print(one, one[i], type(one[i]))
-        xor_result = one[i] ^ two[i]
-        result += bytes([xor_result])
-        # result += format(one[i] ^ two[i], 'x')
-        # print(result, type(result))
+    length = len(one)
 
-    # print('fixed_xor:', type(result), result)
-    return result
+    if out is None and length <= XOR_CHUNK_SIZE:
+        return (int.from_bytes(one, 'little') ^ int.from_bytes(two, 'little')).to_bytes(length, 'little')
+
+    one = memoryview(one)
+    two = memoryview(two)
+    if out is None:
+        result = bytearray(length)
+    else:
+        result = out
+    result_view = memoryview(result)
+    if len(result_view) < length:
+        raise ValueError('Output buffer is too small.', len(result_view), length)
+
+    # xor chunk by chunk
+    for start in range(0, length, XOR_CHUNK_SIZE):
+        end = min(start + XOR_CHUNK_SIZE, length)
+        xored = int.from_bytes(one[start:end], 'little') ^ int.from_bytes(two[start:end], 'little')
+        result_view[start:end] = xored.to_bytes(end - start, 'little')
+
+    if out is None:
+        return bytes(result)
+    return out
 
 
 def single_byte_xor(multiple_byte, single_byte):
-    extended = single_byte * len(multiple_byte)
-    # print('single_byte_xor len:', len(multiple_byte), 'extended:', len(extended), type(extended), extended)
-    return fixed_xor(multiple_byte, extended)
+    '''
+    XOR every byte of multiple_byte with single_byte using a translation table.
+    :param multiple_byte: Bytes
+    :param single_byte: Bytes of length 1, ie. bytes([x])
+    :return: Bytes
+    '''
+    if len(single_byte) != 1:
+        raise ValueError('single_byte must be exactly one byte.', single_byte)
+    return bytes(multiple_byte).translate(XOR_TABLES[single_byte[0]])
+
+
+class SingleByteXorCandidate(util.ScoreOrdered):
+    '''
+    A scored single-byte xor key. Only the key and score are stored, the plaintext is decrypted from the shared
+    ciphertext each time .bytestr is read. Same interface as util.ScoredPlaintext, and ordered by score like it.
+    '''
+    __slots__ = ('cipherbytes', '_key', 'score')
+
+    def __init__(self, cipherbytes, key, score):
+        self.cipherbytes = cipherbytes
+        self._key = key
+        self.score = score
+
+    @property
+    def bytestr(self):
+        return bytes(self.cipherbytes).translate(XOR_TABLES[self._key])
+
+    def key(self):
+        return self._key
+
+    def __str__(self):
+        return "ScoredPlaintext: Key: " + str(self._key) + "\tScore: " + str(self.score) + "\tBytestring: " + str(
+            self.bytestr)
 
 
 def decode_single_byte_xor(cipherbytes):
-    decode_all_single_byte_xor(cipherbytes)[0]
+    return decode_single_byte_xor_histogram(cipherbytes, top_k=1)[0]
 
 
-def decode_all_single_byte_xor(cipherbytes):
+@probe
+@memoized()
+def decode_all_single_byte_xor(cipherbytes, top_k=None, scoring_func=None):
+    '''
+    Try every single-byte xor key and score the results.
+    :param cipherbytes: Bytes
+    :param top_k: Only return the best top_k candidates. None returns all 256.
+    :param scoring_func: Function that scores a plaintext bytestring, higher is better. Defaults to
+    util.plaintext_score_diff_from_norm(). Scorers with a .score_many score the plaintexts in batches of up to
+    SCORE_BATCH_BYTES, all 256 in one call for short ciphertexts, see util.score_many().
+    :return: List of SingleByteXorCandidate, best first.
+    '''
+    if scoring_func is None:
+        scoring_func = util.plaintext_score_diff_from_norm
     # print('Decoding cipherbytes:', len(cipherbytes), type(cipherbytes), cipherbytes)
 
-    # generate and score all possible single-byte xor results
+    # generate the single-byte xor results and score them in batches, all 256 at once for short ciphertexts
+    # only the score is kept, plaintexts are decrypted again if a caller asks for them
+    cipherbytes = bytes(cipherbytes)
+    batch_size = max(1, SCORE_BATCH_BYTES // max(1, len(cipherbytes)))
     scores = []
-    for x in range(256):
-        # print('decode for loop:', hex(x))
-        result = single_byte_xor(cipherbytes, bytes([x]))
-        # print('decode for loop: x:', x, 'result:', type(result), result)
+    for start in range(0, len(XOR_TABLES), batch_size):
+        scores += util.score_many(scoring_func, [cipherbytes.translate(table)
+                                                 for table in XOR_TABLES[start:start + batch_size]])
+    scores = (SingleByteXorCandidate(cipherbytes, x, score) for x, score in enumerate(scores))
+    # Or use a different scoring function:
+    #   Such as: decode_all_single_byte_xor(cipherbytes, scoring_func=util.plaintext_score_complex)
 
-        # scores.append(util.ScoredPlaintext(result, scoring_func=util.plaintext_score_complex))
-        scores.append(util.ScoredPlaintext(result, scoring_func=util.plaintext_score_diff_from_norm, key=x))
-        # Or use a different scoring function:
-        #   Such as: util.ScoredPlaintext(result, scoring_func=util.plaintext_score_complex)
+    # return the most probable results
+    return util.top_k_scored(scores, top_k)
 
-    # return the most probable result
-    scores.sort(key=lambda x: x.score, reverse=True)
 
-    return scores
+def score_single_byte_xor_keys(cipherbytes, histogram_scoring_func=None):
+    '''
+    Score every single-byte xor key without decrypting. The plaintext histogram for key k is the ciphertext histogram
+    with its bins permuted by k, so one pass over the ciphertext is enough for all 256 keys.
+    :param cipherbytes: Bytes
+    :param histogram_scoring_func: Function of (histogram, length) that scores a plaintext from its byte histogram.
+    Defaults to util.plaintext_score_diff_from_norm_histogram().
+    :return: List of 256 scores, indexed by key.
+    '''
+    if histogram_scoring_func is None:
+        histogram_scoring_func = util.plaintext_score_diff_from_norm_histogram
+    histogram = util.byte_histogram(cipherbytes)
+    length = len(cipherbytes)
+    return [histogram_scoring_func(permute(histogram), length) for permute in XOR_HISTOGRAM_PERMUTATIONS]
+
+
+@probe
+@memoized()
+def decode_single_byte_xor_histogram(cipherbytes, top_k=1, histogram_scoring_func=None):
+    '''
+    Like decode_all_single_byte_xor(), but keys are ranked from the ciphertext histogram and nothing is decrypted
+    until a candidate's .bytestr is read. Cost is O(len(cipherbytes) + 256 * 256) no matter how many bytes there are.
+    :param cipherbytes: Bytes
+    :param top_k: How many of the best keys to return. None returns all 256.
+    :param histogram_scoring_func: Function of (histogram, length) used to rank the keys. The default gives the same
+    scores as util.plaintext_score_diff_from_norm().
+    :return: List of SingleByteXorCandidate, best first. Same order as decode_all_single_byte_xor().
+    '''
+    cipherbytes = bytes(cipherbytes)
+    scores = score_single_byte_xor_keys(cipherbytes, histogram_scoring_func)
+    return util.top_k_scored((SingleByteXorCandidate(cipherbytes, key, score) for key, score in enumerate(scores)),
+                             top_k)
+
+
+def scan_single_byte_xor_lines(numbered_lines, top_k, scoring_func=None):
+    '''
+    Worker for scan_single_byte_xor(). Cracks each hex line and keeps the best top_k results of the batch.
+    :param numbered_lines: List of (line_number, hex line) tuples.
+    :param top_k: Number of results to keep.
+    :param scoring_func: Plaintext scorer passed to decode_all_single_byte_xor(). Defaults to
+    util.plaintext_score_ngram().
+    :return: List of ScanResult, best first.
+    '''
+    if scoring_func is None:
+        scoring_func = util.plaintext_score_ngram
+    results = []
+    for line_number, line in numbered_lines:
+        cipherbytes = util.hexbytes_to_bytestr(line.strip())
+        if not cipherbytes:
+            continue
+        candidates = decode_all_single_byte_xor(cipherbytes, top_k=top_k, scoring_func=scoring_func)
+        results.append([(line_number, candidate) for candidate in candidates])
+
+    best = heapq.nlargest(top_k, chain.from_iterable(results), key=lambda result: result[1].score)
+    return [ScanResult(line_number, candidate.key(), candidate.score, candidate.bytestr)
+            for line_number, candidate in best]
+
+
+def scan_single_byte_xor(source, top_k=10, workers=None, batch_lines=SCAN_BATCH_LINES, progress=None,
+                         scoring_func=None):
+    '''
+    Find the lines most likely to be single-byte xor encrypted in a file of hex lines (Set 1, Challenge 4 at scale).
+    Lines are streamed in batches to a pool of worker processes, with a bounded number of batches in flight, so the
+    file is never loaded whole. Results are merged in line order, so the output is the same for any number of workers.
+    :param source: Path of a file, or a binary file object, with one hex ciphertext per line.
+    :param top_k: Number of results to return.
+    :param workers: Number of worker processes. None uses every core, 1 scans in this process.
+    :param batch_lines: Lines per batch sent to a worker.
+    :param progress: Optional function called with the number of lines scanned so far after each batch.
+    :param scoring_func: Plaintext scorer for each line's 256 candidates. It must be a module level function so it can
+    be sent to the workers. Defaults to util.plaintext_score_ngram(), which tells case apart and ranks the English line
+    of 4.txt first, where letter frequency alone puts random lines ahead of it.
+    :return: List of ScanResult(line_number, key, score, plaintext), best first. Line numbers start at 1. Ties are
+    ordered by line number, then key.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with ExitStack() as stack:
+        if isinstance(source, (str, bytes, os.PathLike)):
+            source = stack.enter_context(open(source, 'rb'))
+
+        numbered = enumerate(source, start=1)
+        batch_sizes = deque()
+
+        def batches():
+            for batch in iter(lambda: list(islice(numbered, batch_lines)), []):
+                batch_sizes.append(len(batch))
+                yield batch
+
+        worker = partial(scan_single_byte_xor_lines, top_k=top_k, scoring_func=scoring_func)
+        if workers <= 1:
+            results = map(worker, batches())
+        else:
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(max_workers=workers))
+            results = util.bounded_map(executor, worker, batches(), max_pending=workers * 2)
+
+        best = []
+        lines_done = 0
+        for batch_result in results:
+            # best comes from earlier lines, so ties stay in line order
+            best = heapq.nlargest(top_k, chain(best, batch_result), key=attrgetter('score'))
+            lines_done += batch_sizes.popleft()
+            if progress:
+                progress(lines_done)
+
+    return best
 
 
 def expand_str(text, length):
     return (text * (length // len(text) + 1))[:length]
 
 
+@probe
 def repeating_key_xor(text, key):
     return fixed_xor(text, expand_str(key, len(text)))
 
 
+def repeating_key_xor_stream(source, sink, key, chunk_size=STREAM_CHUNK_SIZE, offset=0):
+    '''
+    Repeating-key xor from a file to a file in fixed size chunks, so memory use doesn't depend on the input size.
+    Gives the same bytes as repeating_key_xor() on the whole input.
+    :param source: Readable binary file object, or path of a file to memory-map.
+    :param sink: Writable binary file object, or path of a file to create.
+    :param key: Bytes
+    :param chunk_size: Bytes per chunk.
+    :param offset: Position in the key of the first byte, ie. the number of bytes already processed when continuing
+    an earlier stream.
+    :return: Number of bytes written.
+    '''
+    if not key:
+        raise ValueError('Key must not be empty.')
+
+    key_len = len(key)
+    # One chunk of key stream, plus one key length so any phase can be sliced from it without copying.
+    keystream = memoryview(expand_str(bytes(key), chunk_size + key_len))
+    out = bytearray(chunk_size)
+    out_view = memoryview(out)
+    phase = offset % key_len
+    written = 0
+
+    with ExitStack() as stack:
+        if isinstance(sink, (str, bytes, os.PathLike)):
+            sink = stack.enter_context(open(sink, 'wb'))
+
+        if isinstance(source, (str, bytes, os.PathLike)):
+            source_file = stack.enter_context(open(source, 'rb'))
+            if os.fstat(source_file.fileno()).st_size == 0:
+                return 0
+            mapped = stack.enter_context(mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ))
+            chunks = (mapped[i:i + chunk_size] for i in range(0, len(mapped), chunk_size))
+        else:
+            chunks = iter(partial(source.read, chunk_size), b'')
+
+        for chunk in chunks:
+            length = len(chunk)
+            fixed_xor(chunk, keystream[phase:phase + length], out=out_view)
+            sink.write(out_view[:length])
+            written += length
+            phase = (phase + length) % key_len
+
+    return written
+
+
+@probe
 def hamming_dist(str_one, str_two):
     '''
     Count the number of bits that differ between two bytestrings.
-    :param str_one:
-    :param str_two:
-    :return:
+    XORs the whole buffers as integers and counts the set bits in one popcount.
+    :param str_one: Bytes
+    :param str_two: Bytes
+    :return: Int number of differing bits.
     '''
     assert len(str_one) == len(str_two)
 
-    sum = 0
-    for i in range(len(str_one)):
-        xored = str_one[i] ^ str_two[i]
-        diff = 0
-        while xored > 0:
-            if xored % 2 == 1:
-                diff += 1
-            xored = xored // 2
-        sum += diff
-        if DEBUG: print(str_one, str_two, str_one[i], str_two[i], diff, sum)
+    return (int.from_bytes(str_one, 'little') ^ int.from_bytes(str_two, 'little')).bit_count()
+
 
-    return sum
+def hamming_matrix(blocks):
+    '''
+    Pairwise hamming distances between N equal length blocks, in one call. Each block is converted to an integer once,
+    so every pair costs one XOR and one popcount.
+    :param blocks: Sequence of N bytestrings of the same length.
+    :return: N x N list of lists, matrix[i][j] is hamming_dist(blocks[i], blocks[j]).
+    '''
+    if len(set(map(len, blocks))) > 1:
+        raise ValueError('Blocks must all be the same length.')
 
+    numbers = [int.from_bytes(block, 'little') for block in blocks]
+    matrix = [[0] * len(numbers) for _ in numbers]
+    for i, j in combinations(range(len(numbers)), 2):
+        matrix[i][j] = matrix[j][i] = (numbers[i] ^ numbers[j]).bit_count()
+    return matrix
 
+
+@memoized()
 def find_xor_key_length(cipher, KEYSIZE_MIN, KEYSIZE_MAX, NUM_BLOCKS):
     '''
 
@@ -122,18 +384,10 @@ def find_xor_key_length(cipher, KEYSIZE_MIN, KEYSIZE_MAX, NUM_BLOCKS):
     distances = []
     KeyLengthTuple = namedtuple('KeyLengthTuple', 'key_len hamming_dist')
     for keylen in range(KEYSIZE_MIN, KEYSIZE_MAX + 1):
-        blocks = []
-        # TODO rewrite as list comprehension
-        for i in range(NUM_BLOCKS):
-            blocks.append(cipher[i * keylen:(i + 1) * keylen])  # 0:keysize, keysize:keysize+keysize,
-        # print(blocks)
-
-        block_hamm_dists = []
-        # for i in range(len(blocks) - 1):
-            # print('hamming:', blocks[i], blocks[i + 1])
-        # block_hamm_dists.append(hamming_dist(blocks[i], blocks[i + 1]))
-        for pair in combinations(blocks, 2):
-            block_hamm_dists.append(hamming_dist(pair[0], pair[1]) / keylen)
+        blocks = [cipher[i * keylen:(i + 1) * keylen] for i in range(NUM_BLOCKS)]
+
+        matrix = hamming_matrix(blocks)
+        block_hamm_dists = [matrix[i][j] / keylen for i, j in combinations(range(len(blocks)), 2)]
 
         dist = statistics.mean(block_hamm_dists)
         distances.append(KeyLengthTuple(keylen, dist))
@@ -141,183 +395,179 @@ def find_xor_key_length(cipher, KEYSIZE_MIN, KEYSIZE_MAX, NUM_BLOCKS):
     def key(keylengthtuple):
         return keylengthtuple.hamming_dist
 
-    distances = sorted(distances, key=key)
-    # pprint(distances)
-
-    # print(min(distances, key=key))
     return min(distances, key=key).key_len
 
 
-
-########
-#  TESTS
-def test_fixed_xor():
-    hexstr = b'1c0111001f010100061a024b53535009181c'
-    one = hexstr
-    two = b'686974207468652062756c6c277320657965'
-
-    onebytestr = util.hexbytes_to_bytestr(one)
-    # print(onebytestr)
-    # print(str(onebytestr))
-    # print(len(onebytestr))
-    xor_result = fixed_xor(onebytestr, util.hexbytes_to_bytestr(two))
-    # print('xor_result', xor_result, type(xor_result))
-    answer = b'746865206b696420646f6e277420706c6179'
-    # print('answer', answer)
-    assert xor_result == util.hexbytes_to_bytestr(answer)
-
-
-def test_singlebyte_xor():
-    cipher_hex_bytes = b'1b37373331363f78151b7f2b783431333d78397828372d363c78373e783a393b3736'
-    cipher_bytestr = util.hexbytes_to_bytestr(cipher_hex_bytes)
-    # print('Test - cipher_bytestr:', cipher_bytestr)
-
-    decode = decode_all_single_byte_xor(cipher_bytestr)[0]
-    # print(decode)
-    assert decode.bytestr == b"Cooking MC's like a pound of bacon"
-
-
-def test_expand_str():
-    assert expand_str('1', 10) == '1111111111'
-    assert expand_str(b'1', 10) == b'1111111111'
-    assert expand_str(b'12', 10) == b'1212121212'
-    assert expand_str(b'12', 11) == b'12121212121'
-
-
-def test_hamming_dist():
-    assert hamming_dist(b'', b'') == 0
-    assert hamming_dist(b'test', b'test') == 0
-    assert hamming_dist(b'a', b'b') == 2
-    assert hamming_dist(b'this is a test', b'wokka wokka!!!') == 37
-    with pytest.raises(TypeError):
-        assert hamming_dist('this is a test', 'wokka wokka!!!') == 37
-
-
-# TODO
-def test_find_xor_key_length():
-    print('find_xor_key_length', find_xor_key_length())
-
-
-###########
-# SOLUTIONS
-def test_solve_set1_chall4():
-    all_plain = []
-    top_plain = []
-    with open('4.txt') as f:
-        for line in f.readlines():
-            if DEBUG: print(line)
-            converted = util.hexbytes_to_bytestr(line.strip().encode())
-            all_plain += decode_all_single_byte_xor(converted)
-            top_plain.append(decode_all_single_byte_xor(converted)[0])
-
-        all_plain.sort(key=lambda x: x.score, reverse=True)
-        top_plain.sort(key=lambda x: x.score, reverse=True)
-
-        print("Place : Result (all decoded scores)")
-        for i in range(10):
-            print(str(i) + ':', all_plain[i])
-
-        print("Place : Result (top decoded scores)")
-        for i in range(10):
-            print(str(i) + ':', top_plain[i])
-
-    assert all_plain[0].bytestr == b'Now that the party is jumping\n'
-    assert top_plain[0].bytestr == b'Now that the party is jumping\n'
-
-
-def test_solve_chall5():
-    answer = repeating_key_xor(b'Burning \'em, if you ain\'t quick and nimble\nI go crazy when I hear a cymbal', b'ICE')
-    # print(answer)
-    # print(util.bytestr_to_hexbytes(answer))
-    assert util.bytestr_to_hexbytes(
-        answer) == b'0b3637272a2b2e63622c2e69692a23693a2a3c6324202d623d63343c2a26226324272765272a282b2f20430a652e2c652a3124333a653e2b2027630c692b20283165286326302e27282f'
-
-
-def test_solve_chall6():
+def key_length_windows(length, key_len, max_bytes=KEY_LENGTH_MAX_BYTES, num_windows=KEY_LENGTH_SAMPLE_WINDOWS):
     '''
-    1) Let KEYSIZE be the guessed length of the key; try values from 2 to (say) 40.
-
-    2) Write a function to compute the edit distance/Hamming distance between two strings. The Hamming distance is just
-    the number of differing bits. The distance between:
-        this is a test
-        and
-        wokka wokka!!!
-        is 37. Make sure your code agrees before you proceed.
-
-    3) For each KEYSIZE, take the first KEYSIZE worth of bytes, and the second KEYSIZE worth of bytes, and find the edit
-    distance between them. Normalize this result by dividing by KEYSIZE.
-
-    4) The KEYSIZE with the smallest normalized edit distance is probably the key. You could proceed perhaps with the smallest 2-3 KEYSIZE values. Or take 4 KEYSIZE blocks instead of 2 and average the distances.
-
-    5) Now that you probably know the KEYSIZE: break the ciphertext into blocks of KEYSIZE length.
-
-    6) Now transpose the blocks: make a block that is the first byte of every block, and a block that is the second byte of every block, and so on.
-
-    7) Solve each block as if it was single-character XOR. You already have code to do this.
-
-    8) For each block, the single-byte XOR key that produces the best looking histogram is the repeating-key XOR key byte for that block. Put them together and you have the key.
+    Block aligned (start, end) windows to sample from a ciphertext. The whole ciphertext if it fits in max_bytes,
+    otherwise num_windows evenly spaced windows adding up to about max_bytes.
     '''
+    num_blocks = length // key_len
+    if num_blocks * key_len <= max_bytes:
+        return [(0, num_blocks * key_len)]
 
-    KEYSIZE_RANGE_MIN = 2  # Inclusive range of possible key sizes to search
-    KEYSIZE_RANGE_MAX = 40
-    NUMBER_OF_BLOCKS = 4  # TODO 2, 4 also suggested.
-
-    with open('6.txt') as f:
-        # cipher_b64 = b''.join([x.rstrip('\n').encode() for x in f.readlines()])
-        cipher_b64_str = ''.join([x.rstrip('\n') for x in f.readlines()])
-        cipher_b64 = cipher_b64_str.encode()
-        # print(cipher)
-        # print()
-
-        # TODO is this really one big string????
-
-        # Un-Base64 AFTER joining, not before
-        # cipher = base_64.base64_to_bytes(cipher_b64) # TODO doesn't match base64 result
-        cipher = base64.b64decode(cipher_b64_str)
-        print()
-        # print(cipher, len(cipher))
-        # print(cipher2, len(cipher2))
-
-        # for cipher in cipher:
-
-        likely_xor_key_length = find_xor_key_length(cipher, KEYSIZE_RANGE_MIN, KEYSIZE_RANGE_MAX, NUMBER_OF_BLOCKS)
-        print('likely_xor_key_length', likely_xor_key_length)
+    window_blocks = max(2, max_bytes // key_len // num_windows)
+    step_blocks = (num_blocks - window_blocks) // max(1, num_windows - 1)
+    return [(i * step_blocks * key_len, (i * step_blocks + window_blocks) * key_len) for i in range(num_windows)]
 
-        transposed = [bytearray(b'') for i in range(likely_xor_key_length)]
-        for block in util.groups(cipher, likely_xor_key_length):
-            if len(block) < likely_xor_key_length:
-                continue
-            for position in range(likely_xor_key_length):
-                transposed[position].append(block[position])
-        # pprint(transposed)
-        # print(len(transposed))
 
-        xor_decoded = []
-        for index, transposed_block in enumerate(transposed):
-            # print('decoding block:', transposed_block)
+def key_length_samples(cipher, key_len, max_bytes=KEY_LENGTH_MAX_BYTES):
+    '''
+    The windows of the ciphertext that xor_key_length_score() compares, as memoryviews of it.
+    :param cipher: Bytes
+    :param key_len: Key length to score.
+    :param max_bytes: Cap on the ciphertext bytes used.
+    :return: List of memoryviews, each a whole number of key_len blocks.
+    '''
+    data = memoryview(cipher)
+    return [data[start:end] for start, end in key_length_windows(len(cipher), key_len, max_bytes)]
 
-            # look at the decode results and scores
-            decoded = decode_all_single_byte_xor(transposed_block)
 
-            xor_decoded.append(decoded[0])
-            # print(index, 'decoding result:', xor_decoded[index])
+def xor_key_length_score(cipher, key_len, max_shifts=KEY_LENGTH_MAX_SHIFTS, max_bytes=KEY_LENGTH_MAX_BYTES):
+    '''
+    Average normalized hamming distance between blocks of key_len bytes. Every block is compared with the blocks up to
+    max_shifts positions after it, over the whole ciphertext or evenly spaced samples of it. Each shift is a single
+    hamming_dist() call on two offset views of the ciphertext.
+    :param cipher: Bytes
+    :param key_len: Key length to score.
+    :param max_shifts: Maximum distance, in blocks, between compared blocks.
+    :param max_bytes: Cap on the ciphertext bytes used.
+    :return: Float, average differing bits per byte. Lower is more likely.
+    '''
+    if len(cipher) < 2 * key_len:
+        raise ValueError('Ciphertext needs at least two blocks of key_len bytes.', len(cipher), key_len)
+    return xor_key_length_score_samples((key_len, key_length_samples(cipher, key_len, max_bytes)), max_shifts)
 
-        # pprint(xor_decoded)
 
-        xor_decoded_bytes = [sp.bytestr for sp in xor_decoded]
-        key = [sp.key() for sp in xor_decoded]
-        print(bytes(key))
+def xor_key_length_score_samples(task, max_shifts=KEY_LENGTH_MAX_SHIFTS):
+    '''
+    xor_key_length_score() over samples already cut from the ciphertext. Worker for rank_xor_key_lengths(), which only
+    sends each key length's samples to the pool instead of the whole ciphertext.
+    :param task: Tuple of (key_len, samples), samples as returned by key_length_samples().
+    :param max_shifts: See xor_key_length_score().
+    :return: Float, see xor_key_length_score().
+    '''
+    key_len, samples = task
+    total_bits = 0
+    total_pairs = 0
+    for sample in samples:
+        sample = memoryview(sample)
+        num_blocks = len(sample) // key_len
+        for shift in range(1, min(max_shifts, num_blocks - 1) + 1):
+            span = (num_blocks - shift) * key_len
+            offset = shift * key_len
+            total_bits += hamming_dist(sample[:span], sample[offset:offset + span])
+            total_pairs += num_blocks - shift
+
+    return total_bits / total_pairs / key_len
+
+
+@memoized(ignore=('workers',))
+def rank_xor_key_lengths(cipher, keysize_min=2, keysize_max=40, max_shifts=KEY_LENGTH_MAX_SHIFTS,
+                         max_bytes=KEY_LENGTH_MAX_BYTES, workers=None):
+    '''
+    Rank repeating-key xor key lengths by average normalized hamming distance over the whole ciphertext.
+    A multiple of the real key length scores about the same as the real one, so a candidate is ranked after any of its
+    divisors that scores within KEY_LENGTH_MULTIPLE_TOLERANCE of it.
+    :param cipher: Bytes
+    :param keysize_min: Smallest key length to try, inclusive.
+    :param keysize_max: Largest key length to try, inclusive. Lengths without two full blocks are skipped.
+    :param max_shifts: See xor_key_length_score().
+    :param max_bytes: See xor_key_length_score().
+    :param workers: Processes used to score key lengths in parallel. None uses every core for ciphertexts of at least
+    PARALLEL_MIN_BYTES and this process for shorter ones.
+    :return: List of KeyLengthCandidate(key_len, score, confidence), most likely first. score is the average normalized
+    hamming distance, confidence is how many standard deviations the score is below the mean of all candidates.
+    '''
+    assert keysize_min <= keysize_max
+
+    key_lens = [key_len for key_len in range(keysize_min, keysize_max + 1) if 2 * key_len <= len(cipher)]
+    if not key_lens:
+        return []
+
+    if workers is None:
+        workers = 1 if len(cipher) < PARALLEL_MIN_BYTES else (os.cpu_count() or 1)
+    if workers <= 1:
+        scores = [xor_key_length_score(cipher, key_len, max_shifts, max_bytes) for key_len in key_lens]
+    else:
+        # each task only carries the at most max_bytes of samples its key length uses, cut in this process
+        tasks = ((key_len, [bytes(sample) for sample in key_length_samples(cipher, key_len, max_bytes)])
+                 for key_len in key_lens)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            scores = list(util.bounded_map(executor, partial(xor_key_length_score_samples, max_shifts=max_shifts),
+                                           tasks, max_pending=workers * 2))
+
+    mean = statistics.mean(scores)
+    stdev = statistics.pstdev(scores)
+    candidates = [KeyLengthCandidate(key_len, score, (mean - score) / stdev if stdev else 0.0)
+                  for key_len, score in zip(key_lens, scores)]
+
+    def rank(candidate):
+        for divisor in candidates:
+            if divisor.key_len < candidate.key_len and candidate.key_len % divisor.key_len == 0 and \
+                    divisor.score <= candidate.score * (1 + KEY_LENGTH_MULTIPLE_TOLERANCE):
+                return candidate.score * (1 + KEY_LENGTH_MULTIPLE_TOLERANCE)
+        return candidate.score
+
+    return sorted(candidates, key=rank)
+
+
+def decode_single_byte_xor_column(column, histogram_scoring_func=None):
+    '''
+    Worker for break_repeating_key_xor(). Best single-byte xor key for one transposed column.
+    :param column: Bytes
+    :param histogram_scoring_func: Function of (histogram, length) used to rank the keys. Defaults to
+    util.plaintext_score_unigram_histogram(), which tells upper from lower case, so a key byte k and the case flipping
+    k ^ 0x20 don't tie like they do on letter frequency.
+    :return: Tuple of (key, score).
+    '''
+    if histogram_scoring_func is None:
+        histogram_scoring_func = util.plaintext_score_unigram_histogram
+    best = decode_single_byte_xor_histogram(column, top_k=1, histogram_scoring_func=histogram_scoring_func)[0]
+    return best.key(), best.score
 
-        # de-transpose
-        result = bytearray()
-        for byte in zip_longest(*xor_decoded_bytes):
-            # print(byte, type(byte))
-            for b in byte:
-                if b:
-                    # print(b)
-                    result.append(b)
-        # print(result, len(result))
-        # print(bytes(result).decode(), len(result))
 
-        # also, instead of detransposing, xor original text with the key
-        print(repeating_key_xor(cipher, key))
+@probe
+@memoized(ignore=('workers',))
+def break_repeating_key_xor(cipher, keysize_min=2, keysize_max=40, num_key_lengths=3,
+                            scoring_func=None, column_scoring_func=None, workers=None):
+    '''
+    Break repeating-key xor (Set 1, Challenge 6). The num_key_lengths most likely key lengths from
+    rank_xor_key_lengths() are tried. For each, the ciphertext is split into columns with strided slices and each
+    column is solved as single-byte xor. The key whose full plaintext scores best wins.
+    :param cipher: Bytes
+    :param keysize_min: Smallest key length to try, inclusive.
+    :param keysize_max: Largest key length to try, inclusive.
+    :param num_key_lengths: How many of the best ranked key lengths to try.
+    :param scoring_func: Scores the full plaintext of each key length tried. Defaults to
+    util.plaintext_score_diff_from_norm().
+    :param column_scoring_func: Histogram scorer for the columns, see decode_single_byte_xor_column(). It must be a
+    module level function so it can be sent to the workers.
+    :param workers: Processes used to solve columns and rank key lengths. None uses every core for ciphertexts of at
+    least PARALLEL_MIN_BYTES and this process for shorter ones.
+    :return: RepeatingKeyXorResult(key, plaintext, score, column_scores). column_scores has the single-byte xor score
+    of each key byte.
+    '''
+    cipher = bytes(cipher)
+    if scoring_func is None:
+        scoring_func = util.plaintext_score_diff_from_norm
+    if workers is None and len(cipher) < PARALLEL_MIN_BYTES:
+        workers = 1
+
+    best = None
+    for candidate in rank_xor_key_lengths(cipher, keysize_min, keysize_max, workers=workers)[:num_key_lengths]:
+        key_len = candidate.key_len
+        # column i is every key_len-th byte starting at i
+        solved = util.parallel_map(partial(decode_single_byte_xor_column, histogram_scoring_func=column_scoring_func),
+                                   util.columns(cipher, key_len), workers=workers)
+
+        key = bytes(key_byte for key_byte, _ in solved)
+        plaintext = repeating_key_xor(cipher, key)
+        result = RepeatingKeyXorResult(key, plaintext, scoring_func(plaintext), [score for _, score in solved])
+        if best is None or result.score > best.score:
+            best = result
+
+    if best is None:
+        raise ValueError('Ciphertext is too short for the key sizes.', len(cipher), keysize_min)
+    return best